@@ -4,11 +4,11 @@ Debug script for Last.fm scrobbling issues
 This script helps debug and clean up Last.fm scrobbling problems
 """
 
+import heapq
 import json
 import os
 import sys
 from datetime import datetime, timedelta
-import time
 
 try:
     import pylast
@@ -16,6 +16,36 @@ except ImportError:
     print("❌ pylast library not found. Install with: pip install pylast")
     sys.exit(1)
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+_YES = frozenset({'y', 'yes'})  # Accepted answers for yes/no prompts
+
+
+def _dumps(obj):
+    """Serialize to indented UTF-8 JSON bytes, using orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode('utf-8')
+
+
+def _loads(data):
+    """Parse JSON from str or bytes, using orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _scrobble_log_path(config):
+    """Path of the bridge's append-only scrobble log"""
+    tracking_config = config.get('tracking', {})
+    tracking_file = tracking_config.get('persistence_file', 'tracking_data.json')
+    default = os.path.splitext(tracking_file)[0] + '_scrobbles.jsonl'
+    return tracking_config.get('scrobble_log_file', default)
+
 
 def analyze_lastfm_scrobbles():
     """Analyze recent Last.fm scrobbles for duplicates"""
@@ -24,8 +54,8 @@ def analyze_lastfm_scrobbles():
     
     # Load config
     try:
-        with open('config.json', 'r') as f:
-            config = json.load(f)
+        with open('config.json', 'rb') as f:
+            config = _loads(f.read())
     except FileNotFoundError:
         print("❌ config.json not found. Please create it from config.example.json")
         return False
@@ -72,38 +102,28 @@ def analyze_lastfm_scrobbles():
         print(f"📈 Found {len(recent_tracks)} recent tracks")
         print()
         
-        # Analyze for duplicates
-        track_counts = {}
+        # Analyze for duplicates: sort all plays by timestamp once, then scan
+        # keeping the previous play of each track to spot repeats within 5 minutes
+        plays = sorted(
+            (int(track.timestamp), f"{track.track.artist} - {track.track.title}")
+            for track in recent_tracks
+            if track.timestamp  # Skip the "now playing" entry
+        )
+        last_seen = {}
         recent_duplicates = []
         
-        for track in recent_tracks:
-            track_key = f"{track.track.artist} - {track.track.title}"
-            timestamp = track.timestamp
-            
-            if track_key not in track_counts:
-                track_counts[track_key] = []
-            
-            track_counts[track_key].append({
-                'timestamp': timestamp,
-                'time_str': datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S') if timestamp else 'Now Playing'
-            })
-        
-        # Find duplicates within a short time window (5 minutes)
-        for track_key, plays in track_counts.items():
-            if len(plays) > 1:
-                # Sort by timestamp
-                plays.sort(key=lambda x: x['timestamp'] or time.time())
-                
-                # Check for plays within 5 minutes of each other
-                for i in range(1, len(plays)):
-                    if plays[i]['timestamp'] and plays[i-1]['timestamp']:
-                        time_diff = plays[i]['timestamp'] - plays[i-1]['timestamp']
-                        if time_diff < 300:  # 5 minutes
-                            recent_duplicates.append({
-                                'track': track_key,
-                                'time_diff': time_diff,
-                                'timestamps': [plays[i-1]['time_str'], plays[i]['time_str']]
-                            })
+        for timestamp, track_key in plays:
+            time_str = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
+            previous = last_seen.get(track_key)
+            if previous is not None:
+                time_diff = timestamp - previous[0]
+                if time_diff < 300:  # 5 minutes
+                    recent_duplicates.append({
+                        'track': track_key,
+                        'time_diff': time_diff,
+                        'timestamps': [previous[1], time_str]
+                    })
+            last_seen[track_key] = (timestamp, time_str)
         
         if recent_duplicates:
             print("⚠️  Potential duplicate scrobbles found:")
@@ -118,42 +138,32 @@ def analyze_lastfm_scrobbles():
         
         # Show current tracking data from persistence
         print("\n📁 Current tracking data:")
-        tracking_file = config.get('tracking', {}).get('persistence_file', 'tracking_data.json')
+        scrobble_log = _scrobble_log_path(config)
         
         try:
-            with open(tracking_file, 'r') as f:
-                tracking_data = json.load(f)
+            # Later lines for the same playback id replace earlier ones
+            tracked = {}
+            with open(scrobble_log, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        entry = _loads(line)
+                        tracked[entry['id']] = entry
             
-            if 'scrobbled_tracks' in tracking_data:
-                scrobbled_count = len(tracking_data['scrobbled_tracks'])
-                print(f"   Tracked scrobbles: {scrobbled_count}")
-                
-                # Show most recent scrobbles from tracking
-                if scrobbled_count > 0:
-                    print("   Most recent tracked scrobbles:")
-                    sorted_scrobbles = sorted(
-                        tracking_data['scrobbled_tracks'].items(),
-                        key=lambda x: x[1]['timestamp'] if isinstance(x[1], dict) else x[1],
-                        reverse=True
-                    )[:5]
-                    
-                    for pid, data in sorted_scrobbles:
-                        if isinstance(data, dict):
-                            track_name = f"{data.get('artist', '?')} - {data.get('title', '?')}"
-                            timestamp = data.get('timestamp', 0)
-                        else:
-                            track_name = pid.split(':')[0:2]  # Extract from playback_id
-                            timestamp = data
-                        
-                        time_str = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-                        print(f"     {track_name} at {time_str}")
-            else:
-                print("   No scrobble tracking data found")
+            scrobbled_count = len(tracked)
+            print(f"   Tracked scrobbles: {scrobbled_count}")
+            
+            # Show most recent scrobbles from tracking
+            if scrobbled_count > 0:
+                print("   Most recent tracked scrobbles:")
+                for entry in heapq.nlargest(5, tracked.values(), key=lambda x: x.get('timestamp', 0)):
+                    track_name = f"{entry.get('artist', '?')} - {entry.get('title', '?')}"
+                    time_str = datetime.fromtimestamp(entry.get('timestamp', 0)).strftime('%Y-%m-%d %H:%M:%S')
+                    print(f"     {track_name} at {time_str}")
                 
         except FileNotFoundError:
-            print(f"   No tracking file found: {tracking_file}")
+            print(f"   No scrobble log found: {scrobble_log}")
         except Exception as e:
-            print(f"   Error reading tracking file: {e}")
+            print(f"   Error reading scrobble log: {e}")
         
         return True
         
@@ -167,33 +177,47 @@ def clear_scrobble_tracking():
     print("🧹 Clearing local scrobble tracking data...")
     
     try:
-        with open('config.json', 'r') as f:
-            config = json.load(f)
+        with open('config.json', 'rb') as f:
+            config = _loads(f.read())
     except FileNotFoundError:
         print("❌ config.json not found")
         return False
     
     tracking_file = config.get('tracking', {}).get('persistence_file', 'tracking_data.json')
+    scrobble_log = _scrobble_log_path(config)
+    
+    # Scrobbles are kept in an append-only log, so clearing is just removing it
+    try:
+        os.unlink(scrobble_log)
+        print(f"✅ Removed scrobble log {scrobble_log}")
+    except FileNotFoundError:
+        print(f"   No scrobble log found: {scrobble_log}")
+    except Exception as e:
+        print(f"❌ Error removing scrobble log: {e}")
+        return False
     
+    # Older versions stored scrobbles inside the tracking file itself
     try:
-        with open(tracking_file, 'r') as f:
-            data = json.load(f)
+        with open(tracking_file, 'rb') as f:
+            data = _loads(f.read())
         
         if 'scrobbled_tracks' in data:
             del data['scrobbled_tracks']
             
-            with open(tracking_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            # Write to a temporary file and swap it in so an interrupted
+            # write never leaves a truncated tracking file behind
+            temp_file = f"{tracking_file}.tmp"
+            with open(temp_file, 'wb') as f:
+                f.write(_dumps(data))
+            os.replace(temp_file, tracking_file)
             
-            print(f"✅ Cleared scrobble tracking data from {tracking_file}")
-            print("   This will allow the app to start fresh with duplicate prevention")
-            return True
-        else:
-            print("   No scrobble tracking data found to clear")
-            return True
+            print(f"✅ Cleared legacy scrobble tracking data from {tracking_file}")
+        
+        print("   This will allow the app to start fresh with duplicate prevention")
+        return True
             
     except FileNotFoundError:
-        print(f"   No tracking file found: {tracking_file}")
+        print("   This will allow the app to start fresh with duplicate prevention")
         return True
     except Exception as e:
         print(f"❌ Error clearing tracking data: {e}")
@@ -220,7 +244,7 @@ def main():
         elif choice == '2':
             print()
             confirm = input("Are you sure you want to clear scrobble tracking? (y/N): ").strip().lower()
-            if confirm in ['y', 'yes']:
+            if confirm in _YES:
                 clear_scrobble_tracking()
             else:
                 print("Cancelled")
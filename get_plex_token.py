@@ -8,6 +8,8 @@ import sys
 from plexapi.myplex import MyPlexAccount
 from plexapi.exceptions import BadRequest, Unauthorized
 
+_YES = frozenset({'y', 'yes'})  # Accepted answers for yes/no prompts
+
 
 def get_plex_token():
     """Get Plex authentication token using PlexAPI"""
@@ -95,5 +97,5 @@ if __name__ == "__main__":
         
         # Ask if they want to test the token
         test = input("\nWould you like to test the token? (y/n): ").lower().strip()
-        if test in ['y', 'yes']:
+        if test in _YES:
             test_token()
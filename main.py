@@ -10,13 +10,21 @@ import time
 import logging
 import sys
 from datetime import datetime
-from typing import Dict, Optional, Any, List
-from threading import Thread
+from typing import Dict, Optional, Any, List, Callable, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache, partial
+from bisect import insort
+from threading import Thread, Lock, Event
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
 import os
+import zlib
 
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
+from paho.mqtt.properties import Properties
+from paho.mqtt.packettypes import PacketTypes
 from plexapi.server import PlexServer
 from plexapi.exceptions import PlexApiException, Unauthorized
 from web_interface import WebInterface
@@ -27,6 +35,18 @@ try:
 except ImportError:
     LASTFM_AVAILABLE = False
 
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 try:
     from ha_mqtt_discoverable import Settings, DeviceInfo
     from ha_mqtt_discoverable.sensors import Sensor, SensorInfo
@@ -34,6 +54,127 @@ try:
 except ImportError:
     HA_DISCOVERABLE_AVAILABLE = False
 
+# Characters that are unsafe in MQTT topic levels, mapped in a single translate pass
+_TOPIC_TABLE = str.maketrans({' ': '_', '/': '_', '#': '', '+': '', '$': ''})
+
+# Home Assistant entity ids use underscores for these separators
+_ENTITY_TABLE = str.maketrans({'-': '_', ' ': '_'})
+
+# Player attributes tried in order when naming a device
+_PLAYER_NAME_ATTRS = ('title', 'device', 'product', 'platform')
+
+# Keys of each entry in the session summary, in payload order
+_SUMMARY_FIELDS = ('user', 'title', 'artist', 'status', 'session_key')
+
+
+def _dumps(obj: Any, pretty: bool = False) -> bytes:
+    """Serialize to UTF-8 JSON bytes, using orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+    if pretty:
+        return json.dumps(obj, indent=2).encode('utf-8')
+    # Compact separators match orjson's output and keep payloads small on the wire
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+# (epoch second, formatted timestamp) of the last _utc_timestamp call, replaced as a whole
+_last_timestamp = (-1, '')
+
+
+def _utc_timestamp() -> str:
+    """Current UTC time as an ISO 8601 string with second precision, formatted once per second"""
+    global _last_timestamp
+    now = int(time.time())
+    if _last_timestamp[0] != now:
+        _last_timestamp = (now, time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now)))
+    return _last_timestamp[1]
+
+
+def _loads(data: Any) -> Any:
+    """Parse JSON from str or bytes, using orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+@lru_cache(maxsize=4096)
+def _fmt_seconds(total_seconds: int) -> str:
+    """Format whole seconds as M:SS or H:MM:SS, cached since positions repeat every poll"""
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    
+    if hours > 0:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    else:
+        return f"{minutes}:{seconds:02d}"
+
+
+def _time_fields(duration_ms: int, offset_ms: int) -> Tuple[float, str, str]:
+    """Progress percent (2 decimals) plus formatted position and remaining time, in integer math"""
+    progress = 0.0
+    if duration_ms > 0:
+        # Percent x100 as a fixed-point integer, rounded half up
+        progress = (offset_ms * 20000 // duration_ms + 1) // 2 / 100
+    return (
+        progress,
+        _fmt_seconds(max(offset_ms, 0) // 1000),
+        _fmt_seconds(max(duration_ms - offset_ms, 0) // 1000)
+    )
+
+
+@dataclass(frozen=True)
+class SessionState:
+    """Change-relevant fields of the last seen state of a session, immutable once stored"""
+    
+    __slots__ = ('status', 'title', 'artist', 'view_offset_bucket', 'key')
+    
+    status: str
+    title: str
+    artist: str
+    view_offset_bucket: int  # viewOffset in 5 second buckets
+    key: str
+    
+    @classmethod
+    def from_music_info(cls, music_info: Dict, key: str) -> 'SessionState':
+        """Build the state for a session from its extracted music info"""
+        return cls(
+            music_info['status'],
+            music_info['title'],
+            music_info['artist'],
+            music_info['viewOffset'] // 5000,
+            key
+        )
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter"""
+    
+    __slots__ = ('rate', 'cap', 'tokens', 'ts', '_lock')
+    
+    def __init__(self, rate: float, cap: int):
+        self.rate = rate  # Tokens added per second
+        self.cap = cap  # Maximum burst size
+        self.tokens = float(cap)
+        self.ts = time.monotonic()
+        self._lock = Lock()
+    
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.cap, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+            
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            
+            # Reserve the next token and wait for it to accrue
+            wait = (1 - self.tokens) / self.rate
+            self.tokens -= 1
+        time.sleep(wait)
+
 
 class PlexMQTTBridge:
     """Main class for bridging Plex API to MQTT"""
@@ -41,28 +182,120 @@ class PlexMQTTBridge:
     def __init__(self, config_file: str = "config.json"):
         """Initialize the bridge with configuration"""
         self.config = self._load_config(config_file)
+        
+        # Config values read on every publish, resolved once
+        self._topic = self.config['mqtt']['topic']
+        self._summary_topic = f"{self._topic}/summary"
+        # Stopped status goes under the base topic since there is no specific user/device/track
+        self._stopped_topic = f"{self._topic}/system/stopped/DATA"
+        self._topic_builder = {
+            'user_device_track': self._topic_user_device_track,
+            'per_user': self._topic_per_user,
+            'per_device': self._topic_per_device,
+            'hierarchical': self._topic_hierarchical
+        }.get(self.config['mqtt'].get('topic_strategy', 'single'), self._topic_single)
+        self._debug = bool(self.config.get('debug', False))
+        self._publish_summary = bool(self.config.get('publish_summary', False))
+        
+        # Session filtering settings, read for every poll
+        multi_config = self.config.get('multi_session_handling', {})
+        self._multi_strategy = multi_config.get('strategy', 'all')
+        self._priority_user = multi_config.get('priority_user', '')
+        self._user_filter = frozenset(multi_config.get('user_filter', []))  # Set for O(1) membership checks
+        
+        # Tracking settings, read for every session
+        tracking_config = self.config.get('tracking', {})
+        self._tracking_enabled = tracking_config.get('enabled', True)
+        self._users_topic = f"{self._topic}/{tracking_config.get('users_topic', 'USERS')}"
+        self._devices_topic = f"{self._topic}/{tracking_config.get('devices_topic', 'DEVICES')}"
+        
         self.mqtt_client = None
         self.plex = None
+        self.alert_listener = None  # Plex websocket notifications, wakes the poll loop early
+        self._poll_wakeup = Event()  # Set by the alert listener when a playback notification arrives
+        self._mqtt_connected = Event()  # Set by on_connect once the broker accepts the connection
+        self._ha_init_pending = False  # Set by on_connect; discovery is (re)initialized on the poll thread
+        self._use_v5 = False  # MQTT v5 selected, resolved in _setup_mqtt
+        self._encode = _dumps  # MQTT payload encoder, switched to MessagePack by mqtt.encoding in _setup_mqtt
+        self._content_type = "application/json"  # v5 ContentType matching _encode
+        self._compress_min_bytes = 0  # Deflate payloads larger than this (v5 only), 0 disables compression
+        self._deflate_props_cache = {}  # id(publish Properties) -> (Properties, copy tagged content_encoding=deflate)
+        self._pub_props_cache = {}  # v5 publish Properties keyed by (status, user, retain), never mutated once built
+        self._summary_props = None  # v5 publish Properties for the session summary
+        self._last_summary_sig = None  # Session fields of the last published summary, None until one is sent
+        self._pending_publishes = []  # (topic, payload, qos, properties, retain, on_published) flushed once per cycle
         self.last_status = {}
+        self._miss_count = {}  # Consecutive polls a known session has been missing from Plex
+        self._current_session_keys = set()  # Session keys seen in the current poll, owned by the poll thread
+        self._active_web_sessions = set()  # Web interface keys seen in the current poll
+        self._track_info_cache = OrderedDict()  # LRU of static per-track metadata keyed by rating keys
+        self._session_info_cache = {}  # sessionKey -> (ratingKey, fields that stay fixed while the track plays)
+        self._topic_level_cache = {}  # Raw user/device name -> sanitized topic level
+        self._last_sig = {}  # sessionKey -> (change signature, last extracted info)
+        self._last_cycle_fp = None  # (sessionKey, state, ratingKey, viewOffset second) per track of the last full cycle
+        self._last_full_cycle = 0.0  # Monotonic time of the last fully processed cycle
+        self._cycle_keepalive = 30.0  # Seconds after which an unchanged cycle is processed anyway
+        self._is_stopped = None  # True once the retained stopped status is set, False while sessions play, None at startup
         self.start_time = datetime.now()
         self.web_interface = None
         
+        # Stopped status fields; _publish_stopped_status stamps and encodes them on each playing -> stopped transition
+        self._stopped_template = {
+            'status': 'stopped',
+            'title': '',
+            'artist': '',
+            'album': '',
+            'thumb': '',
+            'duration': 0,
+            'viewOffset': 0,
+            'progress_percent': 0.0,
+            'duration_formatted': '0:00',
+            'position_formatted': '0:00',
+            'remaining_formatted': '0:00',
+            'device': 'system',
+            'device_original': 'System',
+            'user': 'system'
+        }
+        
         # Track seen users and devices
         self.seen_users = set()
         self.seen_devices = set()
+        self._sorted_users = []  # Sorted views of the sets above, kept in order with bisect.insort
+        self._sorted_devices = []
         self.users_devices_last_published = {
             'users': None,
             'devices': None
         }
+        self._list_dirty = {'users': True, 'devices': True}  # Lists changed since last publish; True so the first cycle publishes
+        self._list_payloads = {'users': None, 'devices': None}  # (values, encoded payload), dropped when a list changes
+        self._tracking_dirty = False  # New users/devices not yet written to the tracking file
+        self._last_tracking_save = 0.0  # Monotonic time of the last tracking file write
+        self._tracking_save_lock = Lock()  # The web API can trigger a save alongside the poll loop
         
         # Last.fm scrobbling setup
         self.lastfm_network = None
-        self.scrobbled_tracks = {}  # Track what we've scrobbled to avoid duplicates
+        lastfm_config = self.config.get('lastfm', {})
+        self._lastfm_min_duration_ms = int(lastfm_config.get('min_duration', 30) * 1000)
+        # scrobble_threshold is a fraction (0.5 = 50%) while progress_percent runs 0-100;
+        # values above 1 are taken as percentages already
+        scrobble_threshold = lastfm_config.get('scrobble_threshold', 0.5)
+        self._lastfm_threshold_percent = scrobble_threshold if scrobble_threshold > 1 else scrobble_threshold * 100
+        self.scrobbled_tracks = OrderedDict()  # Scrobbled play session ids -> timestamp, oldest first
+        self.lastfm_executor = None  # Single worker so Last.fm calls overlap with Plex polling
+        self.lastfm_bucket = TokenBucket(rate=5, cap=10)  # Last.fm allows 5 requests per second
+        self.lastfm_backoff_until = 0.0  # Monotonic time until which Last.fm calls are skipped
+        self.lastfm_backoff_delay = 0  # Current backoff in seconds, doubled on each rate limit error
+        self._lastfm_latest = {}  # session_key -> (newest session data, resumed from pause) waiting for the worker
+        self._lastfm_lock = Lock()  # Guards _lastfm_latest between the poll thread and the worker
+        self._lastfm_now_playing = {}  # session_key -> (artist, title, monotonic expiry) last sent as now playing; worker only
+        self._lastfm_paused = set()  # Session keys last seen paused; poll thread only
         
         # Home Assistant auto discovery setup
         self.ha_sensors = {}  # Store sensor instances keyed by user_device
         self.ha_settings = None  # HA MQTT settings
+        self._ha_device_info = None  # DeviceInfo shared by all sensors, built with ha_settings
         self.ha_last_states = {}  # Track last state for each sensor to detect changes
+        self._entity_id_cache = {}  # (user, device) -> entity id
         
         # Setup logging
         self._setup_logging()
@@ -85,7 +318,7 @@ class PlexMQTTBridge:
         logging_config = self.config.get('logging', {})
         
         # Basic configuration
-        log_level = logging.DEBUG if self.config.get('debug', False) else logging.INFO
+        log_level = logging.DEBUG if self._debug else logging.INFO
         log_format = logging_config.get('format', '%(asctime)s - %(levelname)s - %(message)s')
         
         # Clear existing handlers
@@ -143,15 +376,17 @@ class PlexMQTTBridge:
             web_config = self.config.get('web_interface', {})
             host = web_config.get('host', '0.0.0.0')
             port = web_config.get('port', 5000)
+            # Each open dashboard holds one thread for its session stream
+            threads = web_config.get('threads', 4)
             
             self.logger.info(f"Starting web interface on {host}:{port}")
             
             def run_server():
                 try:
-                    self.logger.info(f"Flask server binding to {host}:{port}")
-                    self.web_interface.run(host=host, port=port, debug=self.config.get('debug', False))
+                    self.logger.info(f"Web server binding to {host}:{port}")
+                    self.web_interface.run(host=host, port=port, debug=self._debug, threads=threads)
                 except Exception as e:
-                    self.logger.error(f"Flask server failed to start: {e}")
+                    self.logger.error(f"Web server failed to start: {e}")
             
             web_thread = Thread(target=run_server, daemon=True)
             web_thread.start()
@@ -164,8 +399,8 @@ class PlexMQTTBridge:
     def _load_config(self, config_file: str) -> Dict[str, Any]:
         """Load configuration from JSON file"""
         try:
-            with open(config_file, 'r') as f:
-                return json.load(f)
+            with open(config_file, 'rb') as f:
+                return _loads(f.read())
         except FileNotFoundError:
             print(f"Config file {config_file} not found. Please copy config.example.json to config.json")
             sys.exit(1)
@@ -184,12 +419,21 @@ class PlexMQTTBridge:
                 plex_config['token']
             )
             
+            # Cached thumbnail URLs are tied to the previous connection
+            self._track_info_cache.clear()
+            self._session_info_cache.clear()
+            self._last_sig.clear()
+            
             # Test connection
             server_info = self.plex.account()
             self.logger.info(f"Connected to Plex server: {self.plex.friendlyName}")
             self.logger.info(f"Server version: {self.plex.version}")
             self.logger.info(f"Account: {server_info.username if server_info else 'Unknown'}")
             
+            # Event-driven updates with polling as fallback
+            if plex_config.get('use_alerts', True):
+                self._start_alert_listener()
+            
             return True
             
         except Unauthorized:
@@ -202,6 +446,60 @@ class PlexMQTTBridge:
             self.logger.error(f"Failed to connect to Plex server: {e}")
             return False
     
+    def _start_alert_listener(self):
+        """Subscribe to Plex server notifications so playback changes trigger an immediate poll"""
+        try:
+            self.alert_listener = self.plex.startAlertListener(
+                callback=self._on_plex_alert,
+                callbackError=self._on_plex_alert_error
+            )
+            self.logger.info("Listening for Plex playback notifications")
+        except Exception as e:
+            self.alert_listener = None
+            self.logger.warning(f"Plex notifications unavailable, falling back to polling only: {e}")
+    
+    def _on_plex_alert(self, message: Dict):
+        """Wake the main loop on playback notifications (runs on the listener thread)"""
+        if message.get('type') == 'playing':
+            self._poll_wakeup.set()
+    
+    def _on_plex_alert_error(self, error: Exception):
+        """Log listener errors; the main loop falls back to polling_interval"""
+        self.logger.warning(f"Plex notification listener error: {error}")
+        self._poll_wakeup.set()
+    
+    def _alerts_active(self) -> bool:
+        """Whether the Plex notification listener is connected and running"""
+        return self.alert_listener is not None and self.alert_listener.is_alive()
+    
+    def _build_publish_properties(self, *user_properties, expiry: Optional[int] = 30) -> Properties:
+        """Build MQTT v5 publish properties with the common expiry, content type and source tags"""
+        properties = Properties(PacketTypes.PUBLISH)
+        if expiry:
+            properties.MessageExpiryInterval = expiry  # Message expires after this many seconds
+        properties.ContentType = self._content_type
+        properties.UserProperty = [("source", "PlexNowPlayingAPI2MQTT"), *user_properties]
+        return properties
+    
+    def _get_publish_properties(self, status: str, user: str, retain: bool = False) -> Properties:
+        """Return cached session publish properties for a status/user/retain combination
+        
+        paho may pack queued messages later, so cached objects are shared but never mutated.
+        Retained messages carry no expiry so the broker keeps them for new subscribers.
+        """
+        # retain is part of the key: retained messages carry no expiry, the others expire after 30s
+        key = (status, user, retain)
+        properties = self._pub_props_cache.get(key)
+        if properties is None:
+            if len(self._pub_props_cache) >= 256:
+                self._pub_props_cache.clear()
+            properties = self._build_publish_properties(
+                ("version", "1.0"), ("status", status), ("user", user),
+                expiry=None if retain else 30
+            )
+            self._pub_props_cache[key] = properties
+        return properties
+    
     def _setup_mqtt(self) -> bool:
         """Setup MQTT client connection with v5 support"""
         try:
@@ -209,7 +507,31 @@ class PlexMQTTBridge:
             
             # Determine MQTT protocol version
             protocol_version = mqtt_config.get('protocol_version', 3.1)
-            if protocol_version == 5:
+            self._use_v5 = protocol_version == 5
+            
+            # Wire format of MQTT payloads; the tracking and scrobble files always stay JSON
+            encoding = mqtt_config.get('encoding', 'json')
+            if encoding == 'msgpack':
+                if MSGPACK_AVAILABLE:
+                    self._encode = partial(msgpack.packb, use_bin_type=True)
+                    self._content_type = "application/msgpack"
+                    self.logger.info("Encoding MQTT payloads as MessagePack")
+                else:
+                    self.logger.warning("msgpack is not installed, falling back to JSON payloads")
+            elif encoding != 'json':
+                self.logger.warning(f"Unknown MQTT payload encoding '{encoding}', using JSON")
+            
+            # Compression can only be signalled to subscribers through v5 user properties
+            compress_min_bytes = mqtt_config.get('compress_min_bytes', 0)
+            if compress_min_bytes and not self._use_v5:
+                self.logger.warning("compress_min_bytes requires MQTT v5, payloads are sent uncompressed")
+            elif compress_min_bytes:
+                self._compress_min_bytes = compress_min_bytes
+                self.logger.info(f"Deflating MQTT payloads larger than {compress_min_bytes} bytes")
+            
+            if self._use_v5:
+                # The summary is retained, so it must not expire on the broker
+                self._summary_props = self._build_publish_properties(("message_type", "summary"), expiry=None)
                 mqtt_protocol = mqtt.MQTTv5
                 callback_api_version = CallbackAPIVersion.VERSION2
                 self.logger.info("Using MQTT v5 protocol")
@@ -233,6 +555,11 @@ class PlexMQTTBridge:
                 )
                 self.logger.info("Using standard MQTT TCP connection")
             
+            # Bound paho's outgoing buffers and back off between reconnect attempts
+            self.mqtt_client.max_inflight_messages_set(mqtt_config.get('max_inflight', 20))
+            self.mqtt_client.max_queued_messages_set(mqtt_config.get('max_queued', 1000))
+            self.mqtt_client.reconnect_delay_set(min_delay=1, max_delay=30)
+            
             # Set credentials if provided
             if mqtt_config.get('username') and mqtt_config.get('password'):
                 self.mqtt_client.username_pw_set(
@@ -260,32 +587,10 @@ class PlexMQTTBridge:
                     # MQTT v3.1.1 WebSocket setup
                     self.mqtt_client.ws_set_options(path=websocket_path)
             
-            # Set up callbacks for better debugging
-            def on_connect(client, userdata, flags, rc, properties=None):
-                if protocol_version == 5:
-                    if rc == 0:
-                        self.logger.info("MQTT v5 connection successful")
-                        # Initialize Home Assistant discovery after MQTT connection
-                        self._init_homeassistant_discovery()
-                    else:
-                        self.logger.error(f"MQTT v5 connection failed with code {rc}")
-                else:
-                    if rc == 0:
-                        self.logger.info("MQTT v3.1.1 connection successful")
-                        # Initialize Home Assistant discovery after MQTT connection
-                        self._init_homeassistant_discovery()
-                    else:
-                        self.logger.error(f"MQTT v3.1.1 connection failed with code {rc}")
-            
-            def on_disconnect(client, userdata, flags=None, rc=None, properties=None):
-                self.logger.warning(f"MQTT disconnected with code {rc}")
-            
-            def on_publish(client, userdata, mid, rc=None, properties=None):
-                self.logger.debug(f"Message {mid} published successfully")
-            
-            self.mqtt_client.on_connect = on_connect
-            self.mqtt_client.on_disconnect = on_disconnect
-            self.mqtt_client.on_publish = on_publish
+            # Callbacks are bound methods, built once rather than as closures on every setup
+            self.mqtt_client.on_connect = self._on_mqtt_connect
+            self.mqtt_client.on_disconnect = self._on_mqtt_disconnect
+            self.mqtt_client.on_publish = self._on_mqtt_publish
             
             # Connect to broker
             self.mqtt_client.connect(
@@ -299,9 +604,14 @@ class PlexMQTTBridge:
             ssl_status = " with SSL/TLS" if mqtt_config.get('use_ssl', False) else ""
             self.logger.info(f"Connecting to MQTT broker at {mqtt_config['broker']}:{mqtt_config['port']} via {connection_type}{ssl_status}")
             
-            # Wait a moment for connection to establish
-            import time
-            time.sleep(2)
+            # Wait for the broker to acknowledge the connection instead of sleeping a fixed time.
+            # Without a CONNACK setup fails rather than carrying on: nothing queued could ever be
+            # delivered, and the container restart policy retries startup instead.
+            connect_timeout = mqtt_config.get('connect_timeout', 10)
+            if not self._mqtt_connected.wait(timeout=connect_timeout):
+                self.logger.error(f"MQTT CONNACK not received within {connect_timeout} seconds")
+                self.mqtt_client.loop_stop()
+                return False
             
             return True
             
@@ -309,176 +619,280 @@ class PlexMQTTBridge:
             self.logger.error(f"Failed to connect to MQTT broker: {e}")
             return False
     
-    def _get_music_sessions(self) -> List[Dict]:
-        """Get current music sessions from Plex"""
+    def _on_mqtt_connect(self, client, userdata, flags, rc, properties=None):
+        """Log the connection result and request Home Assistant setup once connected"""
+        protocol = "MQTT v5" if self._use_v5 else "MQTT v3.1.1"
+        if rc == 0:
+            self.logger.info(f"{protocol} connection successful")
+            # Initialize Home Assistant discovery on the poll thread after MQTT connection
+            self._ha_init_pending = True
+            self._mqtt_connected.set()
+        else:
+            self.logger.error(f"{protocol} connection failed with code {rc}")
+    
+    def _on_mqtt_disconnect(self, client, userdata, flags=None, rc=None, properties=None):
+        """Mark the connection as down until on_connect fires again"""
+        self._mqtt_connected.clear()
+        if rc is None:
+            # The v3.1.1 callback API passes the reason code in place of flags
+            rc = flags
+        self.logger.warning(f"MQTT disconnected with code {rc}")
+    
+    def _on_mqtt_publish(self, client, userdata, mid, rc=None, properties=None):
+        """Log broker acknowledgements, formatting the message only when debug logging is on"""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(f"Message {mid} published successfully")
+    
+    def _get_music_sessions(self, timestamp: Optional[str] = None) -> Optional[List[Dict]]:
+        """Get current music sessions from Plex, or None if nothing changed since the last full cycle"""
+        if timestamp is None:
+            timestamp = _utc_timestamp()
+        
         try:
-            sessions = self.plex.sessions()
-            music_sessions = []
-            
-            for session in sessions:
-                # Only process music/track sessions
+            # Only music/track sessions are processed; raw fields are read once for both fingerprints
+            tracks = []
+            for session in self.plex.sessions():
                 if session.type == 'track':
-                    music_info = self._extract_music_info_from_session(session)
-                    if music_info:
-                        music_sessions.append(music_info)
+                    d = vars(session)
+                    players = getattr(session, 'players', None)
+                    tracks.append((
+                        session,
+                        d.get('sessionKey'),
+                        vars(players[0]).get('state') if players else None,
+                        d.get('viewOffset') or 0,
+                        d.get('ratingKey')
+                    ))
+            
+            # Nothing changed since the last full cycle: skip extraction, filtering and publishing
+            # until the keepalive window runs out (or a missing session still awaits cleanup)
+            cycle_fp = tuple((key, state, rating_key, offset // 1000) for _, key, state, offset, rating_key in tracks)
+            now = time.monotonic()
+            if (cycle_fp == self._last_cycle_fp and not self._miss_count
+                    and now - self._last_full_cycle < self._cycle_keepalive):
+                return None
             
+            music_sessions = []
+            for session, session_key, state, offset, rating_key in tracks:
+                # Skip full extraction while state, track and 5 second position bucket are unchanged
+                sig = (state, offset // 5000, rating_key)
+                last = self._last_sig.get(session_key)
+                if last is not None and last[0] == sig:
+                    music_info = dict(last[1])
+                    music_info['timestamp'] = timestamp
+                else:
+                    music_info = self._extract_music_info_from_session(session, timestamp)
+                    if music_info and session_key is not None:
+                        self._last_sig[session_key] = (sig, music_info)
+                if music_info:
+                    music_sessions.append(music_info)
+            
+            # Drop cached session fields for sessions that have ended
+            if self._session_info_cache or self._last_sig:
+                live_keys = {s.get('session_key') for s in music_sessions}
+                for stale_key in self._session_info_cache.keys() - live_keys:
+                    del self._session_info_cache[stale_key]
+                for stale_key in self._last_sig.keys() - live_keys:
+                    del self._last_sig[stale_key]
+            
+            self._last_cycle_fp = cycle_fp
+            self._last_full_cycle = now
             return music_sessions
             
         except PlexApiException as e:
             self.logger.error(f"Error fetching Plex sessions: {e}")
+            self._last_cycle_fp = None
             return []
         except Exception as e:
             self.logger.error(f"Unexpected error fetching sessions: {e}")
+            self._last_cycle_fp = None
             return []
     
-    def _extract_music_info_from_session(self, session) -> Optional[Dict]:
+    def _extract_music_info_from_session(self, session, timestamp: Optional[str] = None) -> Optional[Dict]:
         """Extract music information from a Plex session object"""
         try:
+            # Snapshot the loaded attributes once; plain dict lookups avoid
+            # PlexAPI's attribute hooks on every field access
+            d = vars(session)
+            
             # Get player state
             player_state = 'unknown'
-            device_name = 'unknown'
+            player_data = {}
+            
+            # players may be a property on newer PlexAPI versions, so resolve it normally
+            players = getattr(session, 'players', None)
+            if players:
+                player_data = vars(players[0])
+                player_state = player_data.get('state', 'unknown')
+            
+            # Device, user and track fields only change when the session moves to another track
+            session_key = d.get('sessionKey')
+            rating_key = d.get('ratingKey')
+            cached = self._session_info_cache.get(session_key) if session_key is not None else None
+            if cached is not None and cached[0] == rating_key:
+                base_info = cached[1]
+            else:
+                base_info = self._get_session_base_info(session, d, player_data)
+                if session_key is not None:
+                    self._session_info_cache[session_key] = (rating_key, base_info)
             
-            if hasattr(session, 'players') and session.players:
-                player = session.players[0]
-                player_state = player.state if hasattr(player, 'state') else 'unknown'
-                
-                # Extract device information
-                if hasattr(player, 'title'):
-                    device_name = player.title
-                elif hasattr(player, 'device'):
-                    device_name = player.device
-                elif hasattr(player, 'product'):
-                    device_name = player.product
-                elif hasattr(player, 'platform'):
-                    device_name = player.platform
-            
-            # Also try to get device info directly from session
-            if device_name == 'unknown':
-                if hasattr(session, 'player') and hasattr(session.player, 'title'):
-                    device_name = session.player.title
-                elif hasattr(session, 'device'):
-                    device_name = session.device
-            
-            # Clean up device name for MQTT topic compatibility
-            device_clean = device_name.replace(' ', '_').replace('/', '_').replace('#', '').replace('+', '').replace('$', '')
-            
-            # Extract basic track information
-            duration = getattr(session, 'duration', 0)
-            view_offset = getattr(session, 'viewOffset', 0)
-            
-            # Calculate progress percentage
-            progress_percent = 0.0
-            if duration > 0:
-                progress_percent = (view_offset / duration) * 100
-                # Round to 2 decimal places
-                progress_percent = round(progress_percent, 2)
+            # Position fields are recomputed on every poll
+            duration = base_info['duration']
+            view_offset = d.get('viewOffset') or 0
+            
+            progress_percent, position_formatted, remaining_formatted = _time_fields(duration, view_offset)
             
-            # Extract track information
             info = {
                 'status': player_state,
-                'title': getattr(session, 'title', 'Unknown'),
-                'artist': getattr(session, 'grandparentTitle', 'Unknown Artist'),
-                'album': getattr(session, 'parentTitle', 'Unknown Album'),
-                'duration': duration,
+                **base_info,
                 'viewOffset': view_offset,
                 'progress_percent': progress_percent,
-                'device': device_clean,
-                'device_original': device_name,
-                'user': session.usernames[0] if session.usernames else 'Unknown',
-                'timestamp': datetime.utcnow().isoformat() + 'Z'
+                'timestamp': timestamp or _utc_timestamp(),
+                'position_formatted': position_formatted,
+                'remaining_formatted': remaining_formatted
             }
             
-            # Get thumbnail URL
-            thumb_url = ''
-            if hasattr(session, 'thumb') and session.thumb:
-                # PlexAPI automatically handles the full URL construction
-                thumb_url = session.thumbUrl
-            elif hasattr(session, 'art') and session.art:
-                thumb_url = session.artUrl
-            
-            info['thumb'] = thumb_url
-            
-            # Add additional metadata if available
-            if hasattr(session, 'year') and session.year:
-                info['year'] = session.year
-            
-            if hasattr(session, 'parentIndex') and session.parentIndex:
-                info['track_number'] = session.parentIndex
-            
-            if hasattr(session, 'index') and session.index:
-                info['disc_number'] = session.index
-            
-            # Add bitrate and format info if available
-            if hasattr(session, 'media') and session.media:
-                media = session.media[0] if session.media else None
-                if media:
-                    if hasattr(media, 'bitrate') and media.bitrate:
-                        info['bitrate'] = media.bitrate
-                    if hasattr(media, 'audioCodec') and media.audioCodec:
-                        info['codec'] = media.audioCodec
-            
-            # Add session key for tracking
-            if hasattr(session, 'sessionKey'):
-                info['session_key'] = session.sessionKey
-            
-            # Add human-readable time formats
-            info['duration_formatted'] = self._format_duration(duration)
-            info['position_formatted'] = self._format_duration(view_offset)
-            info['remaining_formatted'] = self._format_duration(duration - view_offset)
-            
             return info
             
         except Exception as e:
             self.logger.error(f"Error extracting music info from session: {e}")
             return None
     
+    def _get_session_base_info(self, session, d: Dict, player_data: Dict) -> Dict:
+        """Resolve the session fields that stay fixed while a track plays"""
+        # Extract device information from the first non-empty player attribute
+        device_name = next((v for a in _PLAYER_NAME_ATTRS if (v := player_data.get(a))), None)
+        
+        # Also try to get device info directly from session
+        if device_name is None:
+            session_player = getattr(session, 'player', None)
+            device_name = getattr(session_player, 'title', None) or d.get('device') or 'unknown'
+        
+        # Clean up device name for MQTT topic compatibility
+        device_clean = self._topic_level(device_name)
+        
+        duration = d.get('duration') or 0
+        # Read usernames once rather than twice through PlexAPI attribute access
+        usernames = getattr(session, 'usernames', None)
+        
+        # Extract track information in a single dict literal
+        base_info = {
+            **self._get_static_track_info(session, d),
+            'duration': duration,
+            'device': device_clean,
+            'device_original': device_name,
+            'user': usernames[0] if usernames else 'Unknown',
+            'duration_formatted': self._format_duration(duration)
+        }
+        
+        # Add session key for tracking
+        if 'sessionKey' in d:
+            base_info['session_key'] = d['sessionKey']
+        
+        return base_info
+    
+    def _get_static_track_info(self, session, d: Dict) -> Dict:
+        """Get metadata that doesn't change while a track plays, cached per track"""
+        cache_key = (d.get('ratingKey'), d.get('parentRatingKey'), d.get('grandparentRatingKey'))
+        cacheable = cache_key[0] is not None
+        
+        if cacheable:
+            cached = self._track_info_cache.get(cache_key)
+            if cached is not None:
+                self._track_info_cache.move_to_end(cache_key)
+                return cached
+        
+        track_info = {
+            'title': d.get('title', 'Unknown'),
+            'artist': d.get('grandparentTitle', 'Unknown Artist'),
+            'album': d.get('parentTitle', 'Unknown Album')
+        }
+        
+        # Get thumbnail URL; only touch the URL properties when the key is set
+        thumb_url = ''
+        if d.get('thumb'):
+            # PlexAPI automatically handles the full URL construction
+            thumb_url = session.thumbUrl
+        elif d.get('art'):
+            thumb_url = session.artUrl
+        
+        track_info['thumb'] = thumb_url
+        
+        # Add additional metadata if available
+        if d.get('year'):
+            track_info['year'] = d['year']
+        
+        if d.get('parentIndex'):
+            track_info['track_number'] = d['parentIndex']
+        
+        if d.get('index'):
+            track_info['disc_number'] = d['index']
+        
+        # Add bitrate and format info if available; media is loaded lazily by newer PlexAPI
+        # versions and never shows up in vars(session), so it is read as an attribute
+        media_list = getattr(session, 'media', None)
+        media = vars(media_list[0]) if media_list else None
+        if media:
+            if media.get('bitrate'):
+                track_info['bitrate'] = media['bitrate']
+            if media.get('audioCodec'):
+                track_info['codec'] = media['audioCodec']
+        
+        if cacheable:
+            self._track_info_cache[cache_key] = track_info
+            if len(self._track_info_cache) > 512:
+                self._track_info_cache.popitem(last=False)
+        
+        return track_info
+    
     def _format_duration(self, milliseconds: int) -> str:
         """Convert milliseconds to human-readable format (MM:SS or HH:MM:SS)"""
         if milliseconds <= 0:
             return "0:00"
         
-        total_seconds = milliseconds // 1000
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        
-        if hours > 0:
-            return f"{hours}:{minutes:02d}:{seconds:02d}"
-        else:
-            return f"{minutes}:{seconds:02d}"
+        return _fmt_seconds(int(milliseconds) // 1000)
+    
+    def _topic_level(self, name: str) -> str:
+        """Sanitize a user or device name for use as a topic level, memoized per name"""
+        clean = self._topic_level_cache.get(name)
+        if clean is None:
+            if len(self._topic_level_cache) >= 1024:
+                self._topic_level_cache.clear()
+            clean = str(name).translate(_TOPIC_TABLE)
+            self._topic_level_cache[name] = clean
+        return clean
+    
+    def _topic_user_device_track(self, music_info: Dict) -> str:
+        """Format: USER/DEVICE/DATA (where DATA is literal)"""
+        user = self._topic_level(music_info['user'])
+        device = self._topic_level(music_info.get('device', music_info.get('session_key', 'unknown')))
+        return f"{self._topic}/{user}/{device}/DATA"
+    
+    def _topic_per_user(self, music_info: Dict) -> str:
+        """Topic per user: nowplaying/ComputerComa"""
+        return f"{self._topic}/{music_info['user']}"
+    
+    def _topic_per_device(self, music_info: Dict) -> str:
+        """Topic per device/session: nowplaying/session_123"""
+        return f"{self._topic}/session_{music_info.get('session_key', 'unknown')}"
+    
+    def _topic_hierarchical(self, music_info: Dict) -> str:
+        """Hierarchical: nowplaying/ComputerComa/session_123"""
+        return f"{self._topic}/{music_info['user']}/session_{music_info.get('session_key', 'unknown')}"
+    
+    def _topic_single(self, music_info: Dict) -> str:
+        """Default single topic"""
+        return self._topic
     
     def _get_topic_for_session(self, music_info: Dict) -> str:
         """Get the appropriate MQTT topic for a session based on strategy"""
-        base_topic = self.config['mqtt']['topic']
-        topic_strategy = self.config['mqtt'].get('topic_strategy', 'single')
-        
-        if topic_strategy == 'user_device_track':
-            # Format: USER/DEVICE/DATA (where DATA is literal)
-            user = music_info['user'].replace(' ', '_').replace('/', '_')
-            device = music_info.get('device', music_info.get('session_key', 'unknown')).replace(' ', '_').replace('/', '_')
-            return f"{base_topic}/{user}/{device}/DATA"
-        elif topic_strategy == 'per_user':
-            # Topic per user: nowplaying/ComputerComa
-            return f"{base_topic}/{music_info['user']}"
-        elif topic_strategy == 'per_device':
-            # Topic per device/session: nowplaying/device_123
-            session_key = music_info.get('session_key', 'unknown')
-            return f"{base_topic}/session_{session_key}"
-        elif topic_strategy == 'hierarchical':
-            # Hierarchical: nowplaying/ComputerComa/session_123
-            session_key = music_info.get('session_key', 'unknown')
-            return f"{base_topic}/{music_info['user']}/session_{session_key}"
-        else:
-            # Default single topic
-            return base_topic
+        return self._topic_builder(music_info)
     
     def _filter_sessions(self, music_sessions: List[Dict]) -> List[Dict]:
         """Filter sessions based on configuration"""
         if not music_sessions:
             return music_sessions
         
-        multi_config = self.config.get('multi_session_handling', {})
-        strategy = multi_config.get('strategy', 'all')
+        strategy = self._multi_strategy
         
         if strategy == 'all':
             # Return all sessions
@@ -486,7 +900,7 @@ class PlexMQTTBridge:
         
         elif strategy == 'priority_user':
             # Only return sessions from priority user, fallback to first if not found
-            priority_user = multi_config.get('priority_user', '')
+            priority_user = self._priority_user
             if priority_user:
                 priority_sessions = [s for s in music_sessions if s['user'] == priority_user]
                 if priority_sessions:
@@ -500,7 +914,7 @@ class PlexMQTTBridge:
         
         elif strategy == 'user_filter':
             # Filter by specific users
-            allowed_users = multi_config.get('user_filter', [])
+            allowed_users = self._user_filter
             if allowed_users:
                 return [s for s in music_sessions if s['user'] in allowed_users]
             return music_sessions
@@ -515,50 +929,43 @@ class PlexMQTTBridge:
         else:
             return music_sessions
     
-    def _publish_session_summary(self, music_sessions: List[Dict]):
+    def _publish_session_summary(self, music_sessions: List[Dict], timestamp: Optional[str] = None):
         """Publish a summary of all active sessions"""
-        summary_topic = f"{self.config['mqtt']['topic']}/summary"
+        # Collect users and session rows in a single pass; dict keys keep first-seen user order
+        users = {}
+        rows = []
+        for s in music_sessions:
+            user = s['user']
+            users[user] = None
+            rows.append((user, s['title'], s['artist'], s['status'], s.get('session_key', 'unknown')))
+        
+        # Skip the publish when nothing but the timestamp would change
+        # A frozenset ignores order without comparing rows, which may mix None with str or int;
+        # rows never repeat since each carries its session key, and an empty summary stays falsy
+        sig = frozenset(rows)
+        if sig == self._last_summary_sig:
+            return
         
+        # Session dicts are only built for a summary that actually goes out
         summary_data = {
             'active_sessions': len(music_sessions),
-            'users': list(set(s['user'] for s in music_sessions)),
-            'sessions': [
-                {
-                    'user': s['user'],
-                    'title': s['title'],
-                    'artist': s['artist'],
-                    'status': s['status'],
-                    'session_key': s.get('session_key', 'unknown')
-                } for s in music_sessions
-            ],
-            'timestamp': datetime.utcnow().isoformat() + 'Z'
+            'users': list(users),
+            'sessions': [dict(zip(_SUMMARY_FIELDS, row)) for row in rows],
+            'timestamp': timestamp or _utc_timestamp()
         }
         
-        mqtt_config = self.config['mqtt']
-        if mqtt_config.get('protocol_version') == 5:
-            from paho.mqtt.properties import Properties
-            from paho.mqtt.packettypes import PacketTypes
-            
-            properties = Properties(PacketTypes.PUBLISH)
-            properties.MessageExpiryInterval = 30
-            properties.ContentType = "application/json"
-            properties.UserProperty = [
-                ("source", "PlexNowPlayingAPI2MQTT"),
-                ("message_type", "summary")
-            ]
-            
-            result = self.mqtt_client.publish(summary_topic, json.dumps(summary_data), qos=1, properties=properties)
-        else:
-            result = self.mqtt_client.publish(summary_topic, json.dumps(summary_data), qos=1)
-        
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+        def mark_published():
+            self._last_summary_sig = sig
             self.logger.debug(f"Published session summary: {len(music_sessions)} active sessions")
+        
+        # Retained so late subscribers get the current snapshot; it only changes with the sessions
+        self._queue_publish(self._summary_topic, self._encode(summary_data), qos=0, properties=self._summary_props,
+                            retain=True, on_published=mark_published)
     
     def _track_user_and_device(self, music_info: Dict):
         """Track a user and device from session info"""
         # Check if tracking is enabled
-        tracking_config = self.config.get('tracking', {})
-        if not tracking_config.get('enabled', True):
+        if not self._tracking_enabled:
             return
             
         user = music_info.get('user', 'Unknown')
@@ -569,15 +976,14 @@ class PlexMQTTBridge:
         new_device = device not in self.seen_devices
         
         # Add to tracking sets
-        self.seen_users.add(user)
-        self.seen_devices.add(device)
-        
-        # Create/update Home Assistant sensor for user/device combination
-        entity_id = f"{user}_{device}".lower().replace('-', '_').replace(' ', '_')
-        if entity_id not in self.ha_sensors:
-            self._create_ha_sensor(user, device)
+        if new_user:
+            self.seen_users.add(user)
+            insort(self._sorted_users, user)
+        if new_device:
+            self.seen_devices.add(device)
+            insort(self._sorted_devices, device)
         
-        # Update the sensor with current music info
+        # Create/update Home Assistant sensor for user/device combination with current music info
         self._update_ha_sensor(user, device, music_info)
         
         # Log new entries
@@ -586,55 +992,62 @@ class PlexMQTTBridge:
         if new_device:
             self.logger.info(f"New device tracked: {device}")
         
-        # Auto-save if new users or devices were added
-        if (new_user or new_device) and tracking_config.get('auto_save', True):
-            self._save_tracking_data()
+        # Mark for a debounced auto-save and republish if new users or devices were added
+        if new_user:
+            self._list_dirty['users'] = True
+            self._list_payloads['users'] = None
+        if new_device:
+            self._list_dirty['devices'] = True
+            self._list_payloads['devices'] = None
+        if new_user or new_device:
+            self._tracking_dirty = True
+            if self.web_interface:
+                self.web_interface.update_tracking()
     
-    def _publish_users_and_devices(self):
+    def _publish_users_and_devices(self, timestamp: Optional[str] = None):
         """Publish arrays of seen users and devices if they have changed"""
         # Check if tracking is enabled
-        tracking_config = self.config.get('tracking', {})
-        if not tracking_config.get('enabled', True):
+        if not self._tracking_enabled:
             return
         
-        current_users = sorted(list(self.seen_users))
-        current_devices = sorted(list(self.seen_devices))
+        # Nothing was added since the last publish, skip sorting and comparing the lists
+        users_dirty = self._list_dirty['users']
+        devices_dirty = self._list_dirty['devices']
+        if not (users_dirty or devices_dirty):
+            return
         
-        base_topic = self.config['mqtt']['topic']
-        users_topic_suffix = tracking_config.get('users_topic', 'USERS')
-        devices_topic_suffix = tracking_config.get('devices_topic', 'DEVICES')
+        timestamp = timestamp or _utc_timestamp()
         
-        # Check if users list has changed
-        if self.users_devices_last_published['users'] != current_users:
-            users_topic = f"{base_topic}/{users_topic_suffix}"
-            users_data = {
-                'users': current_users,
-                'count': len(current_users),
-                'timestamp': datetime.utcnow().isoformat() + 'Z'
-            }
-            
-            if self._publish_to_mqtt(users_data, users_topic):
-                self.users_devices_last_published['users'] = current_users.copy()
-                self.logger.info(f"Published users list to {users_topic}: {current_users}")
-        
-        # Check if devices list has changed
-        if self.users_devices_last_published['devices'] != current_devices:
-            devices_topic = f"{base_topic}/{devices_topic_suffix}"
-            devices_data = {
-                'devices': current_devices,
-                'count': len(current_devices),
-                'timestamp': datetime.utcnow().isoformat() + 'Z'
-            }
-            
-            if self._publish_to_mqtt(devices_data, devices_topic):
-                self.users_devices_last_published['devices'] = current_devices.copy()
-                self.logger.info(f"Published devices list to {devices_topic}: {current_devices}")
+        if users_dirty:
+            self._queue_list_publish('users', self._sorted_users, self._users_topic, timestamp)
+        if devices_dirty:
+            self._queue_list_publish('devices', self._sorted_devices, self._devices_topic, timestamp)
+    
+    def _queue_list_publish(self, kind: str, sorted_values: List[str], topic: str, timestamp: str):
+        """Queue a retained users or devices list, encoding it only after it changed"""
+        cached = self._list_payloads[kind]
+        if cached is None:
+            # A failed publish leaves the list dirty; the encoded payload is reused on the retry
+            values = list(sorted_values)
+            cached = (values, self._encode({kind: values, 'count': len(values), 'timestamp': timestamp}))
+            self._list_payloads[kind] = cached
+        values, payload = cached
+        
+        # Retained so late subscribers get the current list without a republish every poll
+        self._publish_to_mqtt({}, topic, payload=payload, retain=True,
+                              on_published=partial(self._mark_list_published, kind, values, topic))
+    
+    def _mark_list_published(self, kind: str, values: List[str], topic: str):
+        """Remember a users or devices list once it has been handed to the broker"""
+        self.users_devices_last_published[kind] = values
+        self._list_dirty[kind] = False
+        self.logger.info(f"Published {kind} list to {topic}: {values}")
     
     def get_tracked_users_and_devices(self) -> Dict:
         """Get current tracked users and devices for API/web interface"""
         return {
-            'users': sorted(list(self.seen_users)),
-            'devices': sorted(list(self.seen_devices)),
+            'users': list(self._sorted_users),
+            'devices': list(self._sorted_devices),
             'users_count': len(self.seen_users),
             'devices_count': len(self.seen_devices)
         }
@@ -646,6 +1059,93 @@ class PlexMQTTBridge:
         # Store in the same directory as the application
         return filename
     
+    def _get_scrobble_log_path(self) -> str:
+        """Get the path to the append-only scrobble log"""
+        tracking_config = self.config.get('tracking', {})
+        default = os.path.splitext(self._get_persistence_file_path())[0] + '_scrobbles.jsonl'
+        return tracking_config.get('scrobble_log_file', default)
+    
+    def _load_scrobble_log(self, legacy_scrobbles: Optional[Dict] = None):
+        """Restore recent scrobbles from the JSON Lines log, compacting it if mostly stale"""
+        scrobble_log = self._get_scrobble_log_path()
+        cutoff = int(time.time()) - 86400  # Only keep the last 24 hours
+        live = {}
+        line_count = 0
+        
+        # Entries saved inside tracking_data.json by older versions
+        for playback_id, scrobble_data in (legacy_scrobbles or {}).items():
+            timestamp = scrobble_data.get('timestamp', 0) if isinstance(scrobble_data, dict) else scrobble_data
+            live[playback_id] = {'id': playback_id, 'timestamp': timestamp}
+        
+        try:
+            with open(scrobble_log, 'rb') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    line_count += 1
+                    try:
+                        entry = _loads(line)
+                    except ValueError:
+                        continue  # Skip a partially written last line
+                    live[entry['id']] = entry
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.logger.error(f"Error reading scrobble log {scrobble_log}: {e}")
+            return
+        
+        live = {k: v for k, v in live.items() if v.get('timestamp', 0) > cutoff}
+        # Insert oldest first so eviction from the front of scrobbled_tracks drops the oldest scrobbles
+        for _, entry in sorted(live.items(), key=lambda item: item[1]['timestamp']):
+            self.scrobbled_tracks[self._scrobble_key(entry)] = entry['timestamp']
+        
+        if live:
+            self.logger.info(f"Restored {len(live)} recent scrobbles from {scrobble_log}")
+        
+        # Rewrite the log once stale lines outnumber live entries 10 to 1
+        if legacy_scrobbles or line_count > 10 * max(len(live), 1):
+            try:
+                temp_file = f"{scrobble_log}.tmp"
+                with open(temp_file, 'wb') as f:
+                    for entry in live.values():
+                        f.write(_dumps(entry) + b'\n')
+                os.replace(temp_file, scrobble_log)
+                self.logger.debug(f"Compacted scrobble log {scrobble_log} from {line_count} to {len(live)} entries")
+            except Exception as e:
+                self.logger.error(f"Error compacting scrobble log {scrobble_log}: {e}")
+    
+    @staticmethod
+    def _scrobble_key(entry: Dict) -> Tuple[str, ...]:
+        """scrobbled_tracks key for a scrobble log entry"""
+        if 'session_key' in entry:
+            # str() also covers entries written while the session key was still logged as an int
+            return (entry['user'], str(entry['session_key']), entry['artist'], entry['title'])
+        # Older entries only carry the joined "user:session:artist:title" id
+        return tuple(entry['id'].split(':', 3))
+    
+    def _append_scrobble_log(self, playback_key: Tuple[str, str, str, str], scrobble_params: Dict):
+        """Append a single scrobble event to the JSON Lines log"""
+        tracking_config = self.config.get('tracking', {})
+        if not tracking_config.get('enabled', True) or not tracking_config.get('auto_save', True):
+            return
+        
+        # The joined id stays the log's primary key; the user and session fields rebuild the exact tuple on load
+        entry = {
+            'id': ':'.join(map(str, playback_key)),
+            'user': playback_key[0],
+            'session_key': playback_key[1],
+            'artist': scrobble_params['artist'],
+            'title': scrobble_params['title'],
+            'timestamp': scrobble_params['timestamp']
+        }
+        
+        try:
+            # Append mode maps to O_APPEND, so each event is a single small write
+            with open(self._get_scrobble_log_path(), 'ab') as f:
+                f.write(_dumps(entry) + b'\n')
+        except Exception as e:
+            self.logger.error(f"Error writing scrobble log: {e}")
+    
     def _load_tracking_data(self):
         """Load persistent tracking data from file"""
         tracking_config = self.config.get('tracking', {})
@@ -655,28 +1155,38 @@ class PlexMQTTBridge:
         persistence_file = self._get_persistence_file_path()
         
         try:
-            with open(persistence_file, 'r') as f:
-                data = json.load(f)
+            with open(persistence_file, 'rb') as f:
+                data = _loads(f.read())
                 
             # Load users and devices from file
             if 'users' in data:
                 self.seen_users = set(data['users'])
+                self._sorted_users = sorted(self.seen_users)
                 self.logger.info(f"Loaded {len(self.seen_users)} users from {persistence_file}")
                 
             if 'devices' in data:
                 self.seen_devices = set(data['devices'])
+                self._sorted_devices = sorted(self.seen_devices)
                 self.logger.info(f"Loaded {len(self.seen_devices)} devices from {persistence_file}")
                 
             # Log what was loaded
             if self.seen_users or self.seen_devices:
-                self.logger.info(f"Restored tracking data: {sorted(list(self.seen_users))} users, {sorted(list(self.seen_devices))} devices")
+                self.logger.info(f"Restored tracking data: {self._sorted_users} users, {self._sorted_devices} devices")
+            
+            legacy_scrobbles = data.get('scrobbled_tracks')
                 
         except FileNotFoundError:
             self.logger.info(f"No persistence file found at {persistence_file}, starting with empty tracking data")
+            legacy_scrobbles = None
         except json.JSONDecodeError as e:
             self.logger.error(f"Error reading persistence file {persistence_file}: {e}")
+            legacy_scrobbles = None
         except Exception as e:
             self.logger.error(f"Unexpected error loading tracking data: {e}")
+            legacy_scrobbles = None
+        
+        # Restore scrobble history to prevent duplicates across restarts
+        self._load_scrobble_log(legacy_scrobbles)
     
     def _save_tracking_data(self):
         """Save tracking data to persistent storage"""
@@ -687,40 +1197,38 @@ class PlexMQTTBridge:
         persistence_file = self._get_persistence_file_path()
         
         try:
-            data = {
-                'users': sorted(list(self.seen_users)),
-                'devices': sorted(list(self.seen_devices)),
-                'last_saved': datetime.utcnow().isoformat() + 'Z',
-                'total_users': len(self.seen_users),
-                'total_devices': len(self.seen_devices)
-            }
-            
-            # Save Last.fm scrobble history to prevent duplicates across restarts
-            if hasattr(self, 'scrobbled_tracks') and self.scrobbled_tracks:
-                # Only save recent scrobbles (last 24 hours)
-                current_time = int(time.time())
-                recent_scrobbles = {}
-                for playback_id, scrobble_data in self.scrobbled_tracks.items():
-                    if isinstance(scrobble_data, dict) and 'timestamp' in scrobble_data:
-                        if current_time - scrobble_data['timestamp'] < 86400:  # 24 hours
-                            recent_scrobbles[playback_id] = scrobble_data
-                    elif isinstance(scrobble_data, (int, float)):
-                        # Handle old format (timestamp only)
-                        if current_time - scrobble_data < 86400:
-                            recent_scrobbles[playback_id] = {'timestamp': scrobble_data}
+            with self._tracking_save_lock:
+                # Cleared before the snapshot so additions made during the write mark it dirty again
+                self._tracking_dirty = False
+                self._last_tracking_save = time.monotonic()
                 
-                if recent_scrobbles:
-                    data['scrobbled_tracks'] = recent_scrobbles
-                    self.logger.debug(f"Saved {len(recent_scrobbles)} recent scrobbles to persistence")
-            
-            with open(persistence_file, 'w') as f:
-                json.dump(data, f, indent=2)
+                data = {
+                    'users': list(self._sorted_users),
+                    'devices': list(self._sorted_devices),
+                    'last_saved': _utc_timestamp(),
+                    'total_users': len(self.seen_users),
+                    'total_devices': len(self.seen_devices)
+                }
+                
+                # Scrobble history is persisted separately by _append_scrobble_log
+                
+                # Write to a temp file and swap it in so a crash never leaves a truncated file
+                tmp_file = f"{persistence_file}.tmp"
+                with open(tmp_file, 'wb') as f:
+                    f.write(_dumps(data))
+                os.replace(tmp_file, persistence_file)
                 
             self.logger.debug(f"Saved tracking data to {persistence_file}")
             
         except Exception as e:
+            self._tracking_dirty = True
             self.logger.error(f"Error saving tracking data to {persistence_file}: {e}")
     
+    def _maybe_save_tracking_data(self, min_interval: float = 10.0):
+        """Write pending tracking changes, coalescing bursts into one write per interval"""
+        if self._tracking_dirty and time.monotonic() - self._last_tracking_save >= min_interval:
+            self._save_tracking_data()
+    
     def force_save_tracking_data(self):
         """Force save tracking data (useful for API calls or shutdown)"""
         self._save_tracking_data()
@@ -762,21 +1270,75 @@ class PlexMQTTBridge:
             user = self.lastfm_network.get_user(username)
             user.get_playcount()  # This will fail if auth is bad
             
+            self.lastfm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='lastfm')
+            
             self.logger.info(f"Last.fm scrobbling initialized successfully for user: {username}")
             
         except Exception as e:
             self.logger.error(f"Failed to initialize Last.fm scrobbling: {e}")
             self.lastfm_network = None
     
+    def _lastfm_acquire(self) -> bool:
+        """Wait for a Last.fm rate limit token; returns False while backing off"""
+        if time.monotonic() < self.lastfm_backoff_until:
+            return False
+        self.lastfm_bucket.acquire()
+        return True
+    
+    def _handle_lastfm_error(self, error: Exception):
+        """Back off exponentially when Last.fm reports rate limiting or unavailability"""
+        # 29 = rate limit exceeded, 16 = service temporarily unavailable
+        if isinstance(error, pylast.WSError) and str(error.get_id()) in ('29', '16'):
+            self.lastfm_backoff_delay = min(max(self.lastfm_backoff_delay * 2, 10), 600)
+            self.lastfm_backoff_until = time.monotonic() + self.lastfm_backoff_delay
+            self.logger.warning(f"Last.fm rate limited, pausing requests for {self.lastfm_backoff_delay} seconds")
+    
+    def _submit_lastfm_update(self, session_data: Dict):
+        """Queue now playing and scrobble calls on the Last.fm worker thread
+        
+        At most one job per session is queued; while it waits, newer polls only replace the
+        session data it will use, so a slow Last.fm API cannot build up a backlog.
+        """
+        if not self.lastfm_executor:
+            return
+        
+        key = session_data.get('session_key')
+        resumed = key in self._lastfm_paused
+        if resumed:
+            self._lastfm_paused.discard(key)
+        with self._lastfm_lock:
+            queued = self._lastfm_latest.get(key)
+            # A resume stays flagged when newer data replaces the queued job
+            self._lastfm_latest[key] = (session_data, resumed or (queued is not None and queued[1]))
+        if queued is None:
+            self.lastfm_executor.submit(self._run_lastfm_update, key)
+    
+    def _run_lastfm_update(self, key: Optional[str]):
+        """Send the latest queued data for a session to Last.fm (worker thread)"""
+        with self._lastfm_lock:
+            queued = self._lastfm_latest.pop(key, None)
+        if queued is None:
+            return
+        session_data, resumed = queued
+        
+        # Now playing is refreshed for a new track, after a pause, or once Last.fm has let it
+        # expire, which happens when the track's remaining time has passed since the last send
+        track = (session_data.get('artist'), session_data.get('title'))
+        now = time.monotonic()
+        sent = self._lastfm_now_playing.get(key)
+        stale = resumed or sent is None or sent[:2] != track or now >= sent[2]
+        if stale and self._update_lastfm_now_playing(session_data):
+            remaining = ((session_data.get('duration') or 0) - (session_data.get('viewOffset') or 0)) / 1000
+            if len(self._lastfm_now_playing) >= 100:
+                self._lastfm_now_playing.clear()
+            self._lastfm_now_playing[key] = (*track, now + max(remaining, 30.0))
+        self._scrobble_to_lastfm(session_data)
+    
     def _scrobble_to_lastfm(self, session_data: Dict):
         """Scrobble track to Last.fm if conditions are met"""
         if not self.lastfm_network or not session_data:
             return
         
-        lastfm_config = self.config.get('lastfm', {})
-        scrobble_threshold = lastfm_config.get('scrobble_threshold', 0.5)
-        min_duration = lastfm_config.get('min_duration', 30)
-        
         try:
             # Get track information
             artist = session_data.get('artist', '').strip()
@@ -792,17 +1354,18 @@ class PlexMQTTBridge:
                 self.logger.debug("Skipping scrobble: missing artist or title")
                 return
             
-            if duration < min_duration * 1000:  # duration is in ms
-                self.logger.debug(f"Skipping scrobble: track too short ({duration/1000:.1f}s < {min_duration}s)")
+            if duration < self._lastfm_min_duration_ms:  # duration is in ms
+                self.logger.debug(f"Skipping scrobble: track too short ({duration/1000:.1f}s < {self._lastfm_min_duration_ms // 1000}s)")
                 return
             
             # Create unique identifier for this specific listening session
             # Use Plex's session key which is unique per track play session
-            plex_session_key = session_data.get('session_key', '')
+            # PlexAPI gives an int; kept as str so keys rebuilt from the scrobble log compare equal
+            plex_session_key = str(session_data.get('session_key', ''))
             user = session_data.get('user', 'unknown')
             
-            # Simple track identifier for this specific play session
-            track_session_id = f"{user}:{plex_session_key}:{artist}:{title}"
+            # Tuple key for this specific play session, hashed without building a string per check
+            track_session_id = (user, plex_session_key, artist, title)
             
             # Check if we've already scrobbled this specific track session
             if track_session_id in self.scrobbled_tracks:
@@ -810,12 +1373,12 @@ class PlexMQTTBridge:
                 return
             
             # Check if track has reached scrobble threshold
-            if progress_percent < scrobble_threshold:
-                self.logger.debug(f"Scrobble threshold not reached: {artist} - {title} ({progress_percent:.1%} < {scrobble_threshold:.1%})")
+            if progress_percent < self._lastfm_threshold_percent:
+                self.logger.debug(f"Scrobble threshold not reached: {artist} - {title} ({progress_percent:.1f}% < {self._lastfm_threshold_percent:.1f}%)")
                 return
             
             # Track has reached threshold - proceed with scrobble
-            self.logger.debug(f"Track reached scrobble threshold: {artist} - {title} ({progress_percent:.1%} played)")
+            self.logger.debug(f"Track reached scrobble threshold: {artist} - {title} ({progress_percent:.1f}% played)")
             
             # Prepare scrobble parameters
             scrobble_params = {
@@ -832,17 +1395,19 @@ class PlexMQTTBridge:
             if mbid:
                 scrobble_params['mbid'] = mbid
             
-            # Scrobble the track
+            # Scrobble the track (skipped while backing off; retried on the next poll)
+            if not self._lastfm_acquire():
+                return
             self.lastfm_network.scrobble(**scrobble_params)
+            self.lastfm_backoff_delay = 0
             
             # Mark this track session as scrobbled
             self.scrobbled_tracks[track_session_id] = scrobble_params['timestamp']
+            self._append_scrobble_log(track_session_id, scrobble_params)
             
-            # Clean up old scrobbled tracks (keep only last 100 to handle long-running sessions)
-            if len(self.scrobbled_tracks) > 100:
-                oldest_tracks = sorted(self.scrobbled_tracks.items(), key=lambda x: x[1])[:50]
-                for old_track_id, _ in oldest_tracks:
-                    del self.scrobbled_tracks[old_track_id]
+            # Keep only the last 100 scrobbles; new entries are appended, so the oldest sit at the front
+            while len(self.scrobbled_tracks) > 100:
+                self.scrobbled_tracks.popitem(last=False)
             
             album_info = f" (from {album})" if album else ""
             self.logger.info(f"✓ Scrobbled to Last.fm: {artist} - {title}{album_info}")
@@ -851,13 +1416,14 @@ class PlexMQTTBridge:
             self.logger.error(f"Last.fm network error during scrobble: {e}")
         except pylast.WSError as e:
             self.logger.error(f"Last.fm API error during scrobble: {e}")
+            self._handle_lastfm_error(e)
         except Exception as e:
             self.logger.error(f"Failed to scrobble to Last.fm: {e}")
     
-    def _update_lastfm_now_playing(self, session_data: Dict):
-        """Update Last.fm 'now playing' status"""
+    def _update_lastfm_now_playing(self, session_data: Dict) -> bool:
+        """Update Last.fm 'now playing' status, returning True once Last.fm accepted it"""
         if not self.lastfm_network or not session_data:
-            return
+            return False
         
         try:
             artist = session_data.get('artist', '').strip()
@@ -868,7 +1434,7 @@ class PlexMQTTBridge:
             mbid = session_data.get('musicbrainz_id')
             
             if not artist or not title:
-                return
+                return False
             
             # Prepare now playing parameters
             now_playing_params = {
@@ -886,17 +1452,23 @@ class PlexMQTTBridge:
             if mbid:
                 now_playing_params['mbid'] = mbid
             
+            if not self._lastfm_acquire():
+                return False
             self.lastfm_network.update_now_playing(**now_playing_params)
+            self.lastfm_backoff_delay = 0
             
             album_info = f" (from {album})" if album else ""
             self.logger.debug(f"♪ Updated Last.fm now playing: {artist} - {title}{album_info}")
+            return True
             
         except pylast.NetworkError as e:
             self.logger.error(f"Last.fm network error updating now playing: {e}")
         except pylast.WSError as e:
             self.logger.error(f"Last.fm API error updating now playing: {e}")
+            self._handle_lastfm_error(e)
         except Exception as e:
             self.logger.error(f"Failed to update Last.fm now playing: {e}")
+        return False
     
     def _enhance_track_with_lastfm(self, session_data: Dict) -> Dict:
         """Enhance track data with Last.fm metadata if available"""
@@ -914,7 +1486,9 @@ class PlexMQTTBridge:
             if not artist or not title:
                 return session_data
             
-            # Get track from Last.fm
+            # Get track from Last.fm (no request is made until metadata is read)
+            if time.monotonic() < self.lastfm_backoff_until:
+                return session_data
             track = self.lastfm_network.get_track(artist, title)
             
             # Enhance with Last.fm data
@@ -922,6 +1496,7 @@ class PlexMQTTBridge:
             
             # Add play count if available
             try:
+                self.lastfm_bucket.acquire()
                 playcount = track.get_playcount()
                 if playcount is not None:
                     enhanced_data['lastfm_playcount'] = playcount
@@ -930,6 +1505,7 @@ class PlexMQTTBridge:
             
             # Add tags if available
             try:
+                self.lastfm_bucket.acquire()
                 tags = track.get_top_tags(limit=5)
                 if tags:
                     enhanced_data['lastfm_tags'] = [tag.item.get_name() for tag in tags]
@@ -939,6 +1515,7 @@ class PlexMQTTBridge:
             # Add duration from Last.fm if not available from Plex
             try:
                 if not session_data.get('duration'):
+                    self.lastfm_bucket.acquire()
                     lastfm_duration = track.get_duration()
                     if lastfm_duration:
                         enhanced_data['duration'] = int(lastfm_duration)
@@ -965,15 +1542,21 @@ class PlexMQTTBridge:
             
             user = self.lastfm_network.get_user(username)
             
+            self.lastfm_bucket.acquire()
+            playcount = user.get_playcount()
+            self.lastfm_bucket.acquire()
+            registered = user.get_registered()
+            
             stats = {
                 'username': username,
-                'playcount': user.get_playcount(),
-                'registered': user.get_registered(),
+                'playcount': playcount,
+                'registered': registered,
                 'url': user.get_url()
             }
             
             # Get recent tracks
             try:
+                self.lastfm_bucket.acquire()
                 recent_tracks = user.get_recent_tracks(limit=5)
                 stats['recent_tracks'] = [
                     {
@@ -988,6 +1571,7 @@ class PlexMQTTBridge:
             
             # Get top artists
             try:
+                self.lastfm_bucket.acquire()
                 top_artists = user.get_top_artists(period=pylast.PERIOD_7DAYS, limit=5)
                 stats['top_artists_week'] = [
                     {
@@ -1021,40 +1605,51 @@ class PlexMQTTBridge:
             # Create HA MQTT settings using our existing MQTT client
             self.ha_settings = Settings.MQTT(client=self.mqtt_client)
             
+            # Every sensor belongs to the same bridge device, so its info is built once
+            self._ha_device_info = DeviceInfo(
+                name=ha_config.get('device_name', 'Plex MQTT Bridge'),
+                identifiers=ha_config.get('device_id', 'plex_mqtt_bridge'),
+                manufacturer=ha_config.get('manufacturer', 'ComputerComa'),
+                model=ha_config.get('model', 'Plex MQTT Bridge'),
+                sw_version=ha_config.get('sw_version', '1.0.0')
+            )
+            
             self.logger.info("Home Assistant auto discovery initialized successfully")
             
         except Exception as e:
             self.logger.error(f"Failed to initialize Home Assistant auto discovery: {e}")
             self.ha_settings = None
     
+    def _entity_id(self, user: str, device: str) -> str:
+        """Home Assistant entity id for a user/device pair, cached since pairs repeat every poll"""
+        key = (user, device)
+        entity_id = self._entity_id_cache.get(key)
+        if entity_id is None:
+            entity_id = f"{user}_{device}".translate(_ENTITY_TABLE).lower()
+            # Nothing removes sensors during a run, so the cache is bounded by size instead
+            if len(self._entity_id_cache) >= 1024:
+                self._entity_id_cache.clear()
+            self._entity_id_cache[key] = entity_id
+        return entity_id
+    
     def _create_ha_sensor(self, user: str, device: str):
         """Create Home Assistant sensor for a user/device combination"""
         if not self.ha_settings or not HA_DISCOVERABLE_AVAILABLE:
             return
         
         try:
-            ha_config = self.config.get('homeassistant', {})
-            entity_id = f"{user}_{device}".lower().replace('-', '_').replace(' ', '_')
+            entity_id = self._entity_id(user, device)
             
             # Skip if sensor already exists
             if entity_id in self.ha_sensors:
                 return
             
-            # Device information
-            device_info = DeviceInfo(
-                name=ha_config.get('device_name', 'Plex MQTT Bridge'),
-                identifiers=ha_config.get('device_id', 'plex_mqtt_bridge'),
-                manufacturer=ha_config.get('manufacturer', 'ComputerComa'),
-                model=ha_config.get('model', 'Plex MQTT Bridge'),
-                sw_version=ha_config.get('sw_version', '1.0.0')
-            )
-            
             # Sensor information
             sensor_info = SensorInfo(
                 name=f"Plex {user} {device}",
                 unique_id=f"plex_{entity_id}",
                 icon="mdi:music",
-                device=device_info
+                device=self._ha_device_info
             )
             
             # Create sensor settings
@@ -1080,13 +1675,13 @@ class PlexMQTTBridge:
             return
 
         try:
-            entity_id = f"{user}_{device}".lower().replace('-', '_').replace(' ', '_')
+            entity_id = self._entity_id(user, device)
             
             # Create sensor if it doesn't exist
-            if entity_id not in self.ha_sensors:
-                self._create_ha_sensor(user, device)
-
             sensor = self.ha_sensors.get(entity_id)
+            if sensor is None:
+                self._create_ha_sensor(user, device)
+                sensor = self.ha_sensors.get(entity_id)
             if not sensor:
                 return
 
@@ -1114,7 +1709,7 @@ class PlexMQTTBridge:
             return
 
         try:
-            entity_id = f"{user}_{device}".lower().replace('-', '_').replace(' ', '_')
+            entity_id = self._entity_id(user, device)
             
             if entity_id in self.ha_sensors:
                 # Remove sensor and state tracking
@@ -1126,103 +1721,147 @@ class PlexMQTTBridge:
         except Exception as e:
             self.logger.error(f"Error removing Home Assistant sensor for {user}/{device}: {e}")
     
-    def _publish_to_mqtt(self, data: Dict, topic: str = None) -> bool:
-        """Publish data to MQTT broker with v5 support"""
-        try:
-            if not self.mqtt_client:
-                return False
-            
-            if topic is None:
-                topic = self._get_topic_for_session(data)
-            
-            payload = json.dumps(data, indent=2 if self.config.get('debug', False) else None)
-            
-            # Check if we're using MQTT v5 for enhanced features
-            mqtt_config = self.config['mqtt']
-            if mqtt_config.get('protocol_version') == 5:
-                # MQTT v5 allows for message properties
-                from paho.mqtt.properties import Properties
-                from paho.mqtt.packettypes import PacketTypes
-                
-                properties = Properties(PacketTypes.PUBLISH)
-                properties.MessageExpiryInterval = 30  # Message expires in 30 seconds
-                properties.ContentType = "application/json"
-                
-                # Add user properties for better tracking
-                properties.UserProperty = [
-                    ("source", "PlexNowPlayingAPI2MQTT"),
-                    ("version", "1.0"),
-                    ("status", data.get('status', 'unknown')),
-                    ("user", data.get('user', 'unknown'))
-                ]
-                
-                result = self.mqtt_client.publish(topic, payload, qos=1, properties=properties)
-            else:
-                # Standard MQTT v3.1.1 publish
-                result = self.mqtt_client.publish(topic, payload, qos=1)
+    def _publish_to_mqtt(self, data: Dict, topic: str = None, payload: bytes = None, qos: int = 1,
+                         retain: bool = False, on_published: Optional[Callable[[], None]] = None):
+        """Queue data for the end-of-cycle MQTT flush with v5 support
+        
+        A pre-encoded payload may be passed to skip serializing data. on_published runs once
+        paho has accepted the message, so state that depends on a successful publish is only
+        updated then.
+        """
+        if topic is None:
+            topic = self._get_topic_for_session(data)
+        
+        # Always send minified JSON; pretty-printing is only applied to debug logs
+        if payload is None:
+            payload = self._encode(data)
+        
+        # MQTT v5 allows for message properties
+        properties = None
+        if self._use_v5:
+            properties = self._get_publish_properties(data.get('status', 'unknown'), data.get('user', 'unknown'), retain)
+        
+        self._queue_publish(topic, payload, qos, properties, retain, on_published)
+    
+    def _queue_publish(self, topic: str, payload: bytes, qos: int = 1, properties: Optional[Properties] = None,
+                       retain: bool = False, on_published: Optional[Callable[[], None]] = None):
+        """Add an encoded message to the pending batch"""
+        # Large payloads are deflated when enabled; only v5 properties can flag this to subscribers
+        if self._compress_min_bytes and properties is not None and len(payload) > self._compress_min_bytes:
+            payload = zlib.compress(payload, 1)
+            properties = self._deflate_properties(properties)
+        self._pending_publishes.append((topic, payload, qos, properties, retain, on_published))
+    
+    def _deflate_properties(self, properties: Properties) -> Properties:
+        """Return a cached copy of publish properties tagged with the deflate content encoding"""
+        cached = self._deflate_props_cache.get(id(properties))
+        if cached is None or cached[0] is not properties:
+            if len(self._deflate_props_cache) >= 256:
+                self._deflate_props_cache.clear()
+            tagged = Properties(PacketTypes.PUBLISH)
+            for name in ('MessageExpiryInterval', 'ContentType'):
+                if hasattr(properties, name):
+                    setattr(tagged, name, getattr(properties, name))
+            tagged.UserProperty = [*properties.UserProperty, ("content_encoding", "deflate")]
+            # The original is kept alongside so its id cannot be reused while cached
+            cached = (properties, tagged)
+            self._deflate_props_cache[id(properties)] = cached
+        return cached[1]
+    
+    def _flush_publishes(self) -> int:
+        """Hand every queued message to paho back-to-back so they leave in one write pass"""
+        pending = self._pending_publishes
+        if not pending:
+            return 0
+        self._pending_publishes = []
+        
+        if not self.mqtt_client:
+            return 0
+        
+        published = 0
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        for topic, payload, qos, properties, retain, on_published in pending:
+            try:
+                result = self.mqtt_client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
+            except Exception as e:
+                self.logger.error(f"Error publishing to MQTT: {e}")
+                continue
             
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                self.logger.debug(f"Published to {topic}: {payload}")
-                return True
-            else:
+            if result.rc != mqtt.MQTT_ERR_SUCCESS:
                 self.logger.error(f"Failed to publish to MQTT: {result.rc}")
-                return False
-                
-        except Exception as e:
-            self.logger.error(f"Error publishing to MQTT: {e}")
-            return False
+                continue
+            
+            published += 1
+            # Only pretty-print the payload for logging when debug output is enabled and it is plain JSON
+            # (MessagePack or deflated payloads never start with '{')
+            if debug and payload[:1] == b'{':
+                self.logger.debug("Published to %s: %s", topic, _dumps(_loads(payload), pretty=True).decode('utf-8'))
+            if on_published:
+                on_published()
+        
+        return published
     
-    def _publish_stopped_status(self):
+    def _publish_stopped_status(self, timestamp: Optional[str] = None):
         """Publish stopped status when no music is playing"""
-        stopped_data = {
-            'status': 'stopped',
-            'title': '',
-            'artist': '',
-            'album': '',
-            'thumb': '',
-            'duration': 0,
-            'viewOffset': 0,
-            'progress_percent': 0.0,
-            'duration_formatted': '0:00',
-            'position_formatted': '0:00',
-            'remaining_formatted': '0:00',
-            'device': 'system',
-            'device_original': 'System',
-            'user': 'system',
-            'timestamp': datetime.utcnow().isoformat() + 'Z'
-        }
+        # Encoded per transition so the retained timestamp is when playback stopped
+        stopped_data = dict(self._stopped_template)
+        stopped_data['timestamp'] = timestamp or _utc_timestamp()
+        payload = self._encode(stopped_data)
         
-        # For stopped status, publish to base topic since we don't have specific user/device/track
-        base_topic = self.config['mqtt']['topic']
-        stopped_topic = f"{base_topic}/system/stopped/DATA"
+        def mark_stopped():
+            self._is_stopped = True
+            self.logger.info("No music sessions found - published stopped status")
         
-        self._publish_to_mqtt(stopped_data, stopped_topic)
+        # Retained so subscribers that connect later still see that nothing is playing
+        self._publish_to_mqtt(self._stopped_template, self._stopped_topic, payload, retain=True, on_published=mark_stopped)
     
-    def _should_publish_update(self, music_info: Dict) -> bool:
-        """Determine if we should publish an update based on changes"""
-        session_key = f"{music_info['user']}_{music_info.get('session_key', music_info['title'])}"
-        
-        # Always publish if this is a new session
-        if session_key not in self.last_status:
-            return True
-        
-        last_info = self.last_status[session_key]
-        
-        # Publish if status changed
-        if last_info.get('status') != music_info['status']:
-            return True
-        
-        # Publish if track changed
-        if (last_info.get('title') != music_info['title'] or 
-            last_info.get('artist') != music_info['artist']):
-            return True
-        
-        # Publish if viewOffset changed significantly (more than 5 seconds)
-        offset_diff = abs(music_info['viewOffset'] - last_info.get('viewOffset', 0))
-        if offset_diff > 5000:  # 5 seconds in milliseconds
-            return True
+    def _clear_stopped_status(self):
+        """Remove the retained stopped status once music starts playing again"""
+        def mark_playing():
+            self._is_stopped = False
         
-        return False
+        # An empty retained payload deletes the retained message on the broker
+        self._queue_publish(self._stopped_topic, b'', qos=1, retain=True, on_published=mark_playing)
+    
+    def _log_published_update(self, music_info: Dict, topic: str):
+        """Log a session update once it has been handed to the broker"""
+        self.logger.info(
+            "Published update for %s: %s - %s (%s) to %s",
+            music_info['user'], music_info['artist'], music_info['title'], music_info['status'], topic
+        )
+    
+    def _should_publish_update(self, state: SessionState) -> bool:
+        """Determine if we should publish an update based on changes"""
+        # Publish for new sessions or when status, track or viewOffset bucket changed
+        return self.last_status.get(state.key) != state
+    
+    def _is_progress_only_update(self, state: SessionState) -> bool:
+        """Whether only the playback position changed since the last published state"""
+        previous = self.last_status.get(state.key)
+        return (previous is not None
+                and previous.status == state.status
+                and previous.title == state.title
+                and previous.artist == state.artist)
+    
+    def _wait_for_next_poll(self, deadline: float, last_poll: float, alert_fallback_interval: float,
+                            polling_interval: float) -> float:
+        """Sleep until the next poll is due or a Plex notification arrives, returning the new deadline"""
+        deadline += alert_fallback_interval if self._alerts_active() else polling_interval
+        sleep_for = deadline - time.monotonic()
+        if sleep_for > 0:
+            # A Plex notification cuts the wait short
+            if self._poll_wakeup.wait(sleep_for):
+                self._poll_wakeup.clear()
+                # Coalesce notification bursts into at most one poll per second
+                gap = last_poll + 1.0 - time.monotonic()
+                if gap > 0:
+                    time.sleep(gap)
+                self._poll_wakeup.clear()
+                deadline = time.monotonic()
+        else:
+            # Poll overran the interval; re-anchor instead of bursting to catch up
+            deadline = time.monotonic()
+        return deadline
     
     def run(self):
         """Main execution loop"""
@@ -1237,22 +1876,46 @@ class PlexMQTTBridge:
             sys.exit(1)
         
         polling_interval = self.config.get('polling_interval', 5)
-        self.logger.info(f"Polling Plex every {polling_interval} seconds")
+        # While notifications arrive, polling only acts as a safety net
+        alert_fallback_interval = max(self.config['plex'].get('alert_fallback_interval', 60), polling_interval)
+        if self._alerts_active():
+            self.logger.info(f"Updating on Plex notifications, polling every {alert_fallback_interval} seconds as fallback")
+        else:
+            self.logger.info(f"Polling Plex every {polling_interval} seconds")
+        
+        # Deadline-based scheduling keeps a steady poll cadence regardless of how long each poll takes
+        deadline = time.monotonic()
+        last_poll = 0.0
         
         try:
             while True:
+                # Discovery setup requested by on_connect runs here so HA state is only touched by this thread
+                if self._ha_init_pending:
+                    self._ha_init_pending = False
+                    self._init_homeassistant_discovery()
+                
+                # One timestamp is shared by every payload built during this poll
+                last_poll = time.monotonic()
+                poll_timestamp = _utc_timestamp()
+                
                 # Get current music sessions
-                all_music_sessions = self._get_music_sessions()
+                all_music_sessions = self._get_music_sessions(poll_timestamp)
+                if all_music_sessions is None:
+                    # Same sessions, states and positions as the last full cycle
+                    self._maybe_save_tracking_data()
+                    deadline = self._wait_for_next_poll(deadline, last_poll, alert_fallback_interval, polling_interval)
+                    continue
                 
                 # Apply filtering based on configuration
                 music_sessions = self._filter_sessions(all_music_sessions)
                 
-                # Track which sessions are still active
-                current_session_keys = set()
-                active_web_sessions = set()
+                # Track which sessions are still active (sets reused across polls, cleared in place)
+                current_session_keys = self._current_session_keys
+                active_web_sessions = self._active_web_sessions
+                current_session_keys.clear()
+                active_web_sessions.clear()
                 
                 if music_sessions:
-                    # Publish individual session updates
                     for music_info in music_sessions:
                         session_key = f"{music_info['user']}_{music_info.get('session_key', music_info['title'])}"
                         web_session_key = f"{music_info['user']}_{music_info.get('device', 'unknown')}"
@@ -1262,51 +1925,70 @@ class PlexMQTTBridge:
                         # Track this user and device
                         self._track_user_and_device(music_info)
                         
+                        # Built once and shared by the publish, its log line and the web interface
+                        topic = self._get_topic_for_session(music_info)
+                        
                         # Only publish if there are significant changes
-                        if self._should_publish_update(music_info):
-                            topic = self._get_topic_for_session(music_info)
-                            self._publish_to_mqtt(music_info, topic)
-                            
-                            self.logger.info(f"Published update for {music_info['user']}: {music_info['artist']} - {music_info['title']} ({music_info['status']}) to {topic}")
+                        state = SessionState.from_music_info(music_info, session_key)
+                        if self._should_publish_update(state):
+                            # Position ticks are superseded by the next poll, so they go out at QoS 0
+                            qos = 0 if self._is_progress_only_update(state) else 1
+                            self._publish_to_mqtt(music_info, topic, qos=qos,
+                                                  on_published=partial(self._log_published_update, music_info, topic))
                         
-                        # Last.fm integration
+                        # Last.fm integration runs in the background so slow API calls don't delay polling
                         if music_info.get('status') == 'playing':
-                            self._update_lastfm_now_playing(music_info)
-                            self._scrobble_to_lastfm(music_info)
+                            self._submit_lastfm_update(music_info)
+                        elif music_info.get('status') == 'paused' and self.lastfm_executor:
+                            # Now playing is sent again when this session resumes
+                            if len(self._lastfm_paused) >= 100:
+                                self._lastfm_paused.clear()
+                            self._lastfm_paused.add(music_info.get('session_key'))
                         
                         # Update web interface session data
                         if self.web_interface:
-                            topic = self._get_topic_for_session(music_info)
-                            self.web_interface.update_session(music_info, topic)
+                            self.web_interface.update_session(music_info, topic, web_session_key)
                         
                         # Update last status
-                        self.last_status[session_key] = music_info
+                        self.last_status[session_key] = state
+                        if self._miss_count:
+                            self._miss_count.pop(session_key, None)
                     
                     # Publish users and devices lists if they have changed
-                    self._publish_users_and_devices()
+                    self._publish_users_and_devices(poll_timestamp)
                     
-                    # Publish session summary if we have multiple sessions or summary is enabled
-                    if len(all_music_sessions) > 1 or self.config.get('publish_summary', False):
-                        self._publish_session_summary(all_music_sessions)
+                    # Publish session summary if we have multiple sessions or summary is enabled;
+                    # once a retained summary exists it is kept current
+                    if len(all_music_sessions) > 1 or self._publish_summary or self._last_summary_sig:
+                        self._publish_session_summary(all_music_sessions, poll_timestamp)
                         
                 else:
-                    # No music playing, publish stopped status if not already done
-                    if not self.last_status.get('_stopped', False):
-                        self._publish_stopped_status()
-                        self.logger.info("No music sessions found - published stopped status")
-                        # Clear previous sessions and mark as stopped
-                        self.last_status = {'_stopped': True}
+                    # No music playing, publish the retained stopped status once per transition
+                    if self._is_stopped is not True:
+                        self._publish_stopped_status(poll_timestamp)
+                        # Replace a retained summary with an empty one
+                        if self._last_summary_sig:
+                            self._publish_session_summary([], poll_timestamp)
+                        # Clear previous sessions
+                        self.last_status.clear()
+                        self._miss_count.clear()
                 
                 # Clean up old sessions that are no longer active
                 if current_session_keys:
-                    # Remove the stopped flag if we have active sessions
-                    self.last_status.pop('_stopped', None)
+                    # Drop the retained stopped status (also a stale one from a previous run)
+                    if self._is_stopped is not False:
+                        self._clear_stopped_status()
                     
-                    # Remove sessions that are no longer active
-                    old_keys = set(self.last_status.keys()) - current_session_keys
-                    for old_key in old_keys:
-                        if not old_key.startswith('_'):  # Don't remove internal flags
-                            self.last_status.pop(old_key, None)
+                    # Every current key was just stored, so only a size mismatch means sessions went missing;
+                    # they are dropped after two consecutive misses to ride out PlexAPI jitter
+                    if len(self.last_status) > len(current_session_keys):
+                        for stale_key in [k for k in self.last_status if k not in current_session_keys]:
+                            misses = self._miss_count.get(stale_key, 0) + 1
+                            if misses >= 2:
+                                del self.last_status[stale_key]
+                                del self._miss_count[stale_key]
+                            else:
+                                self._miss_count[stale_key] = misses
                     
                     # Clean up inactive web sessions
                     if self.web_interface:
@@ -1314,15 +1996,29 @@ class PlexMQTTBridge:
                 else:
                     # Clear all web sessions when no music is playing
                     if self.web_interface:
-                        self.web_interface.current_sessions.clear()
+                        self.web_interface.clear_sessions()
                 
-                time.sleep(polling_interval)
+                # Everything queued during this cycle goes out in one burst; with no encoding between
+                # publish() calls, paho's network thread picks up the whole batch in a single write pass
+                self._flush_publishes()
+                
+                # Persist newly seen users/devices at most once every 10 seconds
+                self._maybe_save_tracking_data()
+                
+                deadline = self._wait_for_next_poll(deadline, last_poll, alert_fallback_interval, polling_interval)
                 
         except KeyboardInterrupt:
             self.logger.info("Shutting down...")
         except Exception as e:
             self.logger.error(f"Unexpected error: {e}")
         finally:
+            if self.alert_listener:
+                self.alert_listener.stop()
+            
+            # Let queued Last.fm calls finish so their scrobbles are persisted
+            if self.lastfm_executor:
+                self.lastfm_executor.shutdown(wait=True)
+            
             # Save tracking data before shutdown
             self._save_tracking_data()
             self.logger.info("Saved tracking data before shutdown")
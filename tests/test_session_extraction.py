@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for extracting music info from real PlexAPI session objects
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plexapi.audio import TrackSession
+
+from main import PlexMQTTBridge
+
+TRACK_SESSION_XML = """
+<Track ratingKey="1001" parentRatingKey="1000" grandparentRatingKey="999" key="/library/metadata/1001"
+       type="track" title="Song" parentTitle="Album" grandparentTitle="Artist" duration="240000"
+       viewOffset="60000" sessionKey="42" index="3" parentIndex="1" year="2020">
+  <Media id="1" bitrate="320" audioCodec="mp3" container="mp3" duration="240000">
+    <Part id="1" key="/library/parts/1/file.mp3" duration="240000" container="mp3"/>
+  </Media>
+  <User id="1" title="alice"/>
+  <Player title="Living Room" product="Plexamp" state="playing" machineIdentifier="abc"/>
+  <Session id="s1" bandwidth="1000" location="lan"/>
+</Track>
+"""
+
+
+class ExtractMusicInfoTest(unittest.TestCase):
+    """Extraction against a TrackSession parsed from XML, with PlexAPI's lazy attributes intact"""
+    
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        config = {
+            'plex': {'url': 'http://plex.invalid', 'token': 'token', 'use_alerts': False},
+            'mqtt': {'broker': 'localhost', 'port': 1883, 'topic': 'plex/nowplaying'},
+            'web_interface': {'enabled': False},
+            'tracking': {'enabled': False},
+            'logging': {'file_enabled': False}
+        }
+        config_path = os.path.join(self.tmp.name, 'config.json')
+        with open(config_path, 'w') as f:
+            json.dump(config, f)
+        self.bridge = PlexMQTTBridge(config_path)
+        self.session = TrackSession(None, ElementTree.fromstring(TRACK_SESSION_XML), initpath='/status/sessions')
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def test_stream_info_from_lazy_media(self):
+        info = self.bridge._extract_music_info_from_session(self.session)
+        self.assertEqual(info['bitrate'], 320)
+        self.assertEqual(info['codec'], 'mp3')
+    
+    def test_track_and_player_fields(self):
+        info = self.bridge._extract_music_info_from_session(self.session)
+        self.assertEqual(info['title'], 'Song')
+        self.assertEqual(info['artist'], 'Artist')
+        self.assertEqual(info['album'], 'Album')
+        self.assertEqual(info['user'], 'alice')
+        self.assertEqual(info['status'], 'playing')
+        self.assertEqual(info['session_key'], 42)
+        self.assertEqual(info['progress_percent'], 25.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
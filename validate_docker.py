@@ -11,55 +11,55 @@ import subprocess
 import socket
 from pathlib import Path
 
-def check_docker_installation():
-    """Check if Docker and Docker Compose are installed"""
+def check_docker():
+    """Check Docker, the Docker daemon and Docker Compose"""
     print("🐳 Checking Docker installation...")
     
     try:
-        # Check Docker
-        result = subprocess.run(['docker', '--version'], 
-                              capture_output=True, text=True, shell=True)
-        if result.returncode == 0:
-            print(f"✅ Docker: {result.stdout.strip()}")
-        else:
-            print("❌ Docker not found or not working")
-            return False
+        # A single call reports both the client and, if reachable, the daemon
+        result = subprocess.run(['docker', 'version', '--format', '{{json .}}'],
+                              capture_output=True, text=True)
+        # Exits non-zero when the daemon is down but still prints the client part
+        version = json.loads(result.stdout or 'null') or {}
+    except FileNotFoundError:
+        print("❌ Docker not found")
+        return False
     except Exception as e:
-        print(f"❌ Docker not found: {e}")
+        print(f"❌ Docker not found or not working: {e}")
         return False
     
+    client = version.get('Client') or {}
+    if not client.get('Version'):
+        print("❌ Docker not found or not working")
+        return False
+    print(f"✅ Docker: {client['Version']}")
+    
+    all_good = True
+    
     try:
         # Check Docker Compose
         result = subprocess.run(['docker-compose', '--version'], 
-                              capture_output=True, text=True, shell=True)
+                              capture_output=True, text=True)
         if result.returncode == 0:
             print(f"✅ Docker Compose: {result.stdout.strip()}")
         else:
             print("❌ Docker Compose not found")
-            return False
+            all_good = False
     except Exception as e:
         print(f"❌ Docker Compose not found: {e}")
-        return False
+        all_good = False
     
-    return True
-
-def check_docker_daemon():
-    """Check if Docker daemon is running"""
     print("\n🔄 Checking Docker daemon...")
     
-    try:
-        result = subprocess.run(['docker', 'info'], 
-                              capture_output=True, text=True, shell=True)
-        if result.returncode == 0:
-            print("✅ Docker daemon is running")
-            return True
-        else:
-            print("❌ Docker daemon not running")
-            print("💡 Try starting Docker Desktop")
-            return False
-    except Exception as e:
-        print(f"❌ Cannot connect to Docker daemon: {e}")
-        return False
+    server = version.get('Server') or {}
+    if server.get('Version'):
+        print(f"✅ Docker daemon is running ({server['Version']})")
+    else:
+        print("❌ Docker daemon not running")
+        print("💡 Try starting Docker Desktop")
+        all_good = False
+    
+    return all_good
 
 def check_configuration_files():
     """Check if required configuration files exist"""
@@ -141,17 +141,14 @@ def validate_env_file():
     print("\n🌍 Validating .env file...")
     
     try:
-        with open('.env', 'r') as f:
-            env_content = f.read()
-        
         required_vars = ['PLEX_TOKEN', 'MQTT_BROKER']
-        found_vars = []
+        found_vars = set()
         
-        for line in env_content.split('\n'):
-            line = line.strip()
-            if '=' in line and not line.startswith('#'):
-                var_name = line.split('=')[0]
-                found_vars.append(var_name)
+        with open('.env', 'r') as f:
+            for line in f:
+                line = line.strip()
+                if '=' in line and not line.startswith('#'):
+                    found_vars.add(line.partition('=')[0])
         
         all_good = True
         for var in required_vars:
@@ -209,8 +206,7 @@ def main():
     
     # Run all checks
     checks = [
-        check_docker_installation,
-        check_docker_daemon,
+        check_docker,
         check_configuration_files,
         validate_config_json,
         validate_env_file,
@@ -3,219 +3,567 @@
 Web interface for Plex MQTT Bridge status monitoring
 """
 
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, jsonify, request
 from datetime import datetime
-from threading import Thread
+from threading import Thread, Condition, Timer
+import copy
+import gzip
 import json
+import time
+from operator import itemgetter
+from collections import deque
+
+try:
+    from waitress import serve
+    WAITRESS_AVAILABLE = True
+except ImportError:
+    WAITRESS_AVAILABLE = False
+
+try:
+    import orjson
+    from flask.json.provider import DefaultJSONProvider
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+# (epoch second, local ISO timestamp) of the last _iso_now call, replaced as a whole
+_last_iso = (-1, '')
+
+
+def _iso_now():
+    """Current local time as an ISO 8601 string with second precision, formatted once per second"""
+    global _last_iso
+    now = int(time.time())
+    if _last_iso[0] != now:
+        _last_iso = (now, datetime.fromtimestamp(now).isoformat())
+    return _last_iso[1]
+
+
+# Bodies smaller than this are sent as is; gzip framing would eat most of the saving
+_GZIP_MIN_BYTES = 512
+
+
+def _with_gzip(body):
+    """(plain, gzipped or None) pair for a cached response body, compressed once up front"""
+    if len(body) < _GZIP_MIN_BYTES:
+        return body, None
+    return body, gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def _dumps(obj):
+    """Serialize to compact UTF-8 JSON bytes, using orjson when available"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+if ORJSON_AVAILABLE:
+    class ORJSONProvider(DefaultJSONProvider):
+        """Flask JSON provider backed by orjson, so jsonify responses skip the str round trip"""
+        
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default).decode('utf-8')
+        
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+        
+        def response(self, *args, **kwargs):
+            # orjson already produces UTF-8 bytes, which become the response body as-is
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(orjson.dumps(obj, default=self.default), mimetype=self.mimetype)
+
+
+# Fallbacks for session fields missing from the bridge's music info
+_SESSION_DEFAULTS = {
+    'user': 'Unknown',
+    'device': 'Unknown',
+    'device_original': 'Unknown',
+    'title': '',
+    'artist': '',
+    'album': '',
+    'status': 'unknown',
+    'progress_percent': 0,
+    'duration_formatted': '0:00',
+    'position_formatted': '0:00',
+    'remaining_formatted': '0:00',
+    'thumb': '',
+    'year': '',
+    'track_number': '',
+    'bitrate': '',
+    'codec': ''
+}
+
+# Session fields copied into each web session entry, in payload order
+_SESSION_FIELDS = tuple(_SESSION_DEFAULTS)
+_session_values = itemgetter(*_SESSION_FIELDS)
+
+
+# (URL rule, endpoint and WebInterface method name, HTTP methods) of every route
+_ROUTES = (
+    ('/', 'index', ('GET',)),
+    ('/api/status', 'api_status', ('GET',)),
+    ('/api/sessions', 'api_sessions', ('GET',)),
+    ('/api/stream', 'api_stream', ('GET',)),
+    ('/api/users-devices', 'api_users_devices', ('GET',)),
+    ('/api/users-devices/save', 'api_save_tracking', ('POST',)),
+    ('/api/users', 'api_users', ('GET',)),
+    ('/api/devices', 'api_devices', ('GET',)),
+    ('/api/config', 'api_config', ('GET',)),
+    ('/api/lastfm/stats', 'api_lastfm_stats', ('GET',)),
+)
 
 
 class WebInterface:
     """Simple web interface for monitoring the Plex MQTT Bridge"""
     
+    __slots__ = (
+        'bridge', 'app', 'current_sessions', '_has_start_time', '_has_ha_sensors', '_start_monotonic',
+        '_uptime', '_status_cache', '_active_keys', '_session_json', '_active_snapshot', '_sessions_version',
+        '_sessions_changed', '_stream_frame', '_stream_clients', '_push_pending', '_config_body',
+        '_index_body', '_static_status', '_tracking_version', '_etag_prefix', '_tracking_bodies',
+        '_sessions_body', '_change_ring', '_max_streams'
+    )
+    
     def __init__(self, bridge_instance):
         self.bridge = bridge_instance
         self.app = Flask(__name__)
+        self.app.config['TEMPLATES_AUTO_RELOAD'] = False
+        if ORJSON_AVAILABLE:
+            self.app.json = ORJSONProvider(self.app)
         self.current_sessions = {}
+        # Whether the bridge carries these never changes after startup, so check it once
+        self._has_start_time = hasattr(bridge_instance, 'start_time')
+        self._has_ha_sensors = hasattr(bridge_instance, 'ha_sensors')
+        # Bridge start on the monotonic clock, so uptime needs no datetime arithmetic per request
+        self._start_monotonic = None
+        if self._has_start_time:
+            self._start_monotonic = time.monotonic() - (datetime.now() - bridge_instance.start_time).total_seconds()
+        self._uptime = (-1, "00:00:00")  # (whole seconds, formatted uptime) from the last call
+        self._status_cache = (0.0, None)  # (monotonic time, encoded /api/status body), reset when sessions change
+        self._active_keys = {}  # Keys of current_sessions that are playing or paused; a dict keeps them in dashboard order
+        self._session_json = {}  # session_key -> encoded current_sessions entry
+        self._active_snapshot = ()  # Encoded active sessions, replaced as a whole after every change
+        self._sessions_body = (-1, None)  # (sessions version, /api/sessions body pair) for the last poll
+        self._change_ring = deque(maxlen=256)  # (sessions version, session_key, encoded entry or None if no longer active)
+        self._sessions_version = 0  # Bumped on every session change, used as the /api/sessions ETag
+        self._sessions_changed = Condition()  # Guards the stream state below, notified when a frame is pushed
+        self._stream_frame = (0, b'')  # (sequence, encoded SSE frame) last pushed to /api/stream clients
+        self._stream_clients = 0  # Open /api/stream responses
+        self._max_streams = 2  # Cap on _stream_clients, derived from the thread count in run()
+        self._push_pending = False  # A coalesced push is already scheduled
+        self._config_body = None  # Encoded /api/config body pair, built on first request
+        self._index_body = None  # Rendered dashboard page body pair, built on first request
+        self._static_status = self._build_static_status()
+        self._tracking_version = 0  # Bumped by update_tracking, used as the tracking ETag
+        self._etag_prefix = f"{int(time.time()):x}-"  # Keeps ETags from a previous run from matching after a restart
+        self._tracking_bodies = None  # (ETag, users-devices, users, devices body pairs)
+        self.update_tracking()
         self.setup_routes()
     
     def setup_routes(self):
         """Setup Flask routes"""
+        for rule, endpoint, methods in _ROUTES:
+            self.app.add_url_rule(rule, endpoint, getattr(self, endpoint), methods=methods)
+    
+    def index(self):
+        """Main status page"""
+        # The template has no per-request data, so it is rendered once and served as bytes
+        if self._index_body is None:
+            self._index_body = _with_gzip(render_template('index.html').encode('utf-8'))
+        return self._body_response(self._index_body, mimetype='text/html')
+    
+    def api_status(self):
+        """API endpoint for current status, rebuilt at most once per second"""
+        built_at, body = self._status_cache
+        if body is not None and time.monotonic() - built_at < 1.0:
+            return self.app.response_class(body, mimetype='application/json')
         
-        @self.app.route('/')
-        def index():
-            """Main status page"""
-            return render_template('index.html')
+        tracking_data = self.bridge.get_tracked_users_and_devices()
+        status_data = dict(self._static_status)
+        status_data.update({
+            'server_connected': self.bridge.plex is not None,
+            'mqtt_connected': self.bridge.mqtt_client is not None and self.bridge.mqtt_client.is_connected(),
+            'server_name': getattr(self.bridge.plex, 'friendlyName', 'Unknown') if self.bridge.plex else 'Not Connected',
+            'server_version': getattr(self.bridge.plex, 'version', 'Unknown') if self.bridge.plex else 'Unknown',
+            'uptime': self.get_uptime(),
+            'active_sessions_count': len(self._active_snapshot),
+            'total_sessions': len(self.current_sessions),
+            'tracked_users_count': tracking_data['users_count'],
+            'tracked_devices_count': tracking_data['devices_count'],
+            'lastfm_connected': self.bridge.lastfm_network is not None,
+            'homeassistant_discovered_entities': len(self.bridge.ha_sensors) if self._has_ha_sensors else 0
+        })
+        response = jsonify(status_data)
+        self._status_cache = (time.monotonic(), response.get_data())
+        return response
+    
+    def api_sessions(self):
+        """API endpoint for current active sessions, or only their changes with ?since=<version>"""
+        version = self._sessions_version
+        etag = f"{self._etag_prefix}{version}"
+        since = self._parse_since(request.args.get('since'), version)
+        if since is not None:
+            changes = self._get_changes(since, version)
+            if changes is not None:
+                return self._conditional_response(etag, lambda: _with_gzip(self._delta_body(changes, etag)))
+        return self._conditional_response(etag, lambda: self._get_sessions_pair(version))
+    
+    def api_stream(self):
+        """Server-Sent Events stream pushing the /api/sessions payload whenever it changes"""
+        # Every open stream holds a server thread; past the cap the dashboard polls instead
+        with self._sessions_changed:
+            if self._stream_clients >= self._max_streams:
+                return jsonify({'error': 'Too many open streams, poll /api/sessions instead'}), 503
+            self._stream_clients += 1
+            sequence = self._stream_frame[0]
         
-        @self.app.route('/api/status')
-        def api_status():
-            """API endpoint for current status"""
-            tracking_data = self.bridge.get_tracked_users_and_devices()
-            status_data = {
-                'server_connected': self.bridge.plex is not None,
-                'mqtt_connected': self.bridge.mqtt_client is not None and self.bridge.mqtt_client.is_connected(),
-                'server_name': getattr(self.bridge.plex, 'friendlyName', 'Unknown') if self.bridge.plex else 'Not Connected',
-                'server_version': getattr(self.bridge.plex, 'version', 'Unknown') if self.bridge.plex else 'Unknown',
-                'mqtt_broker': self.bridge.config['mqtt']['broker'],
-                'mqtt_port': self.bridge.config['mqtt']['port'],
-                'mqtt_protocol': f"MQTT v{self.bridge.config['mqtt'].get('protocol_version', '3.1')}",
-                'websockets': self.bridge.config['mqtt'].get('use_websockets', False),
-                'ssl': self.bridge.config['mqtt'].get('use_ssl', False),
-                'topic_strategy': self.bridge.config['mqtt'].get('topic_strategy', 'single'),
-                'polling_interval': self.bridge.config.get('polling_interval', 5),
-                'uptime': self.get_uptime(),
-                'active_sessions_count': len([s for s in self.current_sessions.values() if s.get('status') in ['playing', 'paused']]),
-                'total_sessions': len(self.current_sessions),
-                'tracked_users_count': tracking_data['users_count'],
-                'tracked_devices_count': tracking_data['devices_count'],
-                'lastfm_enabled': self.bridge.config.get('lastfm', {}).get('enabled', False),
-                'lastfm_connected': self.bridge.lastfm_network is not None,
-                'lastfm_username': self.bridge.config.get('lastfm', {}).get('username', '') if self.bridge.config.get('lastfm', {}).get('enabled', False) else None,
-                'homeassistant_enabled': self.bridge.config.get('homeassistant', {}).get('enabled', False),
-                'homeassistant_discovered_entities': len(self.bridge.ha_sensors) if hasattr(self.bridge, 'ha_sensors') else 0
-            }
-            return jsonify(status_data)
+        def generate(sequence):
+            # Streams end after a while so a waitress thread is never held forever; the
+            # browser's EventSource reconnects on its own after the advertised retry delay
+            deadline = time.monotonic() + 300
+            yield b'retry: 3000\n\n'
+            yield b'data: ' + self.get_sessions_body() + b'\n\n'
+            while time.monotonic() < deadline:
+                with self._sessions_changed:
+                    if sequence == self._stream_frame[0]:
+                        self._sessions_changed.wait(15)
+                    current, frame = self._stream_frame
+                if current == sequence:
+                    yield b': keepalive\n\n'
+                    continue
+                sequence = current
+                yield frame
         
-        @self.app.route('/api/sessions')
-        def api_sessions():
-            """API endpoint for current active sessions"""
-            active_sessions = [
-                session for session in self.current_sessions.values() 
-                if session.get('status') in ['playing', 'paused']
-            ]
+        response = self.app.response_class(generate(sequence), mimetype='text/event-stream',
+                                           headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        # Released when the server closes the response, even if the stream was never started
+        response.call_on_close(self._release_stream)
+        return response
+    
+    def _release_stream(self):
+        """Free the /api/stream slot of a closed response"""
+        with self._sessions_changed:
+            self._stream_clients -= 1
+    
+    def api_users_devices(self):
+        """API endpoint for tracked users and devices"""
+        etag, body = self._tracking_bodies[:2]
+        return self._conditional_response(etag, lambda: body)
+    
+    def api_save_tracking(self):
+        """API endpoint to manually save tracking data"""
+        try:
+            self.bridge.force_save_tracking_data()
             return jsonify({
-                'sessions': active_sessions,
-                'count': len(active_sessions),
-                'last_updated': datetime.now().isoformat()
+                'success': True,
+                'message': 'Tracking data saved successfully',
+                'timestamp': _iso_now()
+            })
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e),
+                'timestamp': _iso_now()
+            }), 500
+    
+    def api_users(self):
+        """API endpoint for tracked users only"""
+        etag, _, body, _ = self._tracking_bodies
+        return self._conditional_response(etag, lambda: body)
+    
+    def api_devices(self):
+        """API endpoint for tracked devices only"""
+        etag, _, _, body = self._tracking_bodies
+        return self._conditional_response(etag, lambda: body)
+    
+    def api_config(self):
+        """API endpoint for configuration (sanitized)"""
+        # The config does not change at runtime, so the sanitized body is encoded once
+        if self._config_body is None:
+            self._config_body = _with_gzip(jsonify(self.get_sanitized_config()).get_data())
+        return self._body_response(self._config_body)
+    
+    def api_lastfm_stats(self):
+        """API endpoint for Last.fm user statistics"""
+        if not self.bridge.config.get('lastfm', {}).get('enabled', False):
+            return jsonify({
+                'enabled': False,
+                'message': 'Last.fm integration is disabled'
             })
         
-        @self.app.route('/api/users-devices')
-        def api_users_devices():
-            """API endpoint for tracked users and devices"""
-            tracking_data = self.bridge.get_tracked_users_and_devices()
-            # Add persistence info
-            tracking_config = self.bridge.config.get('tracking', {})
-            tracking_data['persistence_enabled'] = tracking_config.get('enabled', True) and tracking_config.get('auto_save', True)
-            tracking_data['persistence_file'] = tracking_config.get('persistence_file', 'tracking_data.json')
-            return jsonify(tracking_data)
-        
-        @self.app.route('/api/users-devices/save', methods=['POST'])
-        def api_save_tracking():
-            """API endpoint to manually save tracking data"""
-            try:
-                self.bridge.force_save_tracking_data()
-                return jsonify({
-                    'success': True,
-                    'message': 'Tracking data saved successfully',
-                    'timestamp': datetime.now().isoformat()
-                })
-            except Exception as e:
-                return jsonify({
-                    'success': False,
-                    'error': str(e),
-                    'timestamp': datetime.now().isoformat()
-                }), 500
-        
-        @self.app.route('/api/users')
-        def api_users():
-            """API endpoint for tracked users only"""
-            tracking_data = self.bridge.get_tracked_users_and_devices()
+        if not self.bridge.lastfm_network:
             return jsonify({
-                'users': tracking_data['users'],
-                'count': tracking_data['users_count'],
-                'last_updated': datetime.now().isoformat()
+                'enabled': True,
+                'connected': False,
+                'message': 'Last.fm connection not available'
             })
         
-        @self.app.route('/api/devices')
-        def api_devices():
-            """API endpoint for tracked devices only"""
-            tracking_data = self.bridge.get_tracked_users_and_devices()
+        try:
+            stats = self.bridge.get_lastfm_user_stats()
             return jsonify({
-                'devices': tracking_data['devices'],
-                'count': tracking_data['devices_count'],
-                'last_updated': datetime.now().isoformat()
+                'enabled': True,
+                'connected': True,
+                'stats': stats,
+                'last_updated': _iso_now()
             })
+        except Exception as e:
+            return jsonify({
+                'enabled': True,
+                'connected': False,
+                'error': str(e),
+                'last_updated': _iso_now()
+            }), 500
+    
+    def _build_static_status(self):
+        """/api/status fields that only depend on the config, resolved once"""
+        config = self.bridge.config
+        mqtt_config = config['mqtt']
+        lastfm_config = config.get('lastfm', {})
+        lastfm_enabled = lastfm_config.get('enabled', False)
+        return {
+            'mqtt_broker': mqtt_config['broker'],
+            'mqtt_port': mqtt_config['port'],
+            'mqtt_protocol': f"MQTT v{mqtt_config.get('protocol_version', '3.1')}",
+            'websockets': mqtt_config.get('use_websockets', False),
+            'ssl': mqtt_config.get('use_ssl', False),
+            'topic_strategy': mqtt_config.get('topic_strategy', 'single'),
+            'polling_interval': config.get('polling_interval', 5),
+            'lastfm_enabled': lastfm_enabled,
+            'lastfm_username': lastfm_config.get('username', '') if lastfm_enabled else None,
+            'homeassistant_enabled': config.get('homeassistant', {}).get('enabled', False)
+        }
+    
+    def update_tracking(self):
+        """Re-encode the tracked users/devices responses; called by the bridge when either list grows"""
+        tracking_data = self.bridge.get_tracked_users_and_devices()
+        last_updated = _iso_now()
+        users = {'users': tracking_data['users'], 'count': tracking_data['users_count'], 'last_updated': last_updated}
+        devices = {'devices': tracking_data['devices'], 'count': tracking_data['devices_count'], 'last_updated': last_updated}
         
-        @self.app.route('/api/config')
-        def api_config():
-            """API endpoint for configuration (sanitized)"""
-            config_copy = self.bridge.config.copy()
-            # Remove sensitive information
-            if 'plex' in config_copy:
-                config_copy['plex']['token'] = '***HIDDEN***'
-            if 'mqtt' in config_copy:
-                if 'password' in config_copy['mqtt']:
-                    config_copy['mqtt']['password'] = '***HIDDEN***'
-            if 'lastfm' in config_copy:
-                if 'api_key' in config_copy['lastfm']:
-                    config_copy['lastfm']['api_key'] = '***HIDDEN***'
-                if 'api_secret' in config_copy['lastfm']:
-                    config_copy['lastfm']['api_secret'] = '***HIDDEN***'
-                if 'password' in config_copy['lastfm']:
-                    config_copy['lastfm']['password'] = '***HIDDEN***'
-            
-            return jsonify(config_copy)
+        # Add persistence info
+        tracking_config = self.bridge.config.get('tracking', {})
+        tracking_data['persistence_enabled'] = tracking_config.get('enabled', True) and tracking_config.get('auto_save', True)
+        tracking_data['persistence_file'] = tracking_config.get('persistence_file', 'tracking_data.json')
+        
+        # Swapped in as one tuple so a request never mixes bodies from two updates
+        self._tracking_version += 1
+        self._tracking_bodies = (f"{self._etag_prefix}{self._tracking_version}", _with_gzip(_dumps(tracking_data)),
+                                 _with_gzip(_dumps(users)), _with_gzip(_dumps(devices)))
+    
+    def _conditional_response(self, etag, build_body):
+        """JSON response tagged with a weak ETag, or an empty 304 when the client already has it"""
+        if request.if_none_match.contains_weak(etag):
+            response = self.app.response_class(status=304)
+            response.vary.add('Accept-Encoding')
+        else:
+            response = self._body_response(build_body())
+        response.set_etag(etag, weak=True)
+        # Browsers revalidate every poll instead of reusing a cached copy unasked
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    def _body_response(self, body, mimetype='application/json'):
+        """Response for a cached body pair, gzipped when the client accepts it and the body is large"""
+        plain, compressed = body
+        if compressed is not None and request.accept_encodings['gzip']:
+            response = self.app.response_class(compressed, mimetype=mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = self.app.response_class(plain, mimetype=mimetype)
+        # Set even on uncompressed bodies, so a shared cache never reuses one encoding for the other
+        response.vary.add('Accept-Encoding')
+        return response
+    
+    def _get_sessions_pair(self, version):
+        """/api/sessions body pair for a sessions version, encoded and compressed once per version"""
+        cached_version, body = self._sessions_body
+        if cached_version != version:
+            body = _with_gzip(self.get_sessions_body())
+            self._sessions_body = (version, body)
+        return body
+    
+    def get_sanitized_config(self):
+        """Deep copy of the bridge config with credentials hidden"""
+        # A deep copy keeps the masking from reaching the nested dicts the bridge still uses
+        config_copy = copy.deepcopy(self.bridge.config)
+        if 'plex' in config_copy:
+            config_copy['plex']['token'] = '***HIDDEN***'
+        if 'mqtt' in config_copy:
+            if 'password' in config_copy['mqtt']:
+                config_copy['mqtt']['password'] = '***HIDDEN***'
+        if 'lastfm' in config_copy:
+            if 'api_key' in config_copy['lastfm']:
+                config_copy['lastfm']['api_key'] = '***HIDDEN***'
+            if 'api_secret' in config_copy['lastfm']:
+                config_copy['lastfm']['api_secret'] = '***HIDDEN***'
+            if 'password' in config_copy['lastfm']:
+                config_copy['lastfm']['password'] = '***HIDDEN***'
+        return config_copy
+    
+    def get_sessions_body(self):
+        """Encoded /api/sessions payload, joined from the per-session bytes encoded in update_session"""
+        # The version is read before the snapshot, so it can only lag behind the sessions it is
+        # sent with; a client replaying changes from there just applies some of them twice
+        version = self._sessions_version
+        active_sessions = self.get_active_sessions_json()
+        return b''.join((
+            b'{"sessions":[', b','.join(active_sessions),
+            b'],"count":', str(len(active_sessions)).encode('ascii'),
+            b',"version":', _dumps(f"{self._etag_prefix}{version}"),
+            b',"last_updated":', _dumps(_iso_now()), b'}'
+        ))
+    
+    def _parse_since(self, since, version):
+        """Sessions version a ?since= value refers to, or None if it is missing or not from this run"""
+        if not since or not since.startswith(self._etag_prefix):
+            return None
+        try:
+            since = int(since[len(self._etag_prefix):])
+        except ValueError:
+            return None
+        return since if 0 <= since <= version else None
+    
+    def _get_changes(self, since, version):
+        """Latest change per session between two versions, or None once the ring no longer covers them"""
+        ring = tuple(self._change_ring)  # One-step copy, the poll loop keeps appending
+        # Nothing after `since` was evicted if the ring never filled or still reaches back to it
+        if len(ring) == self._change_ring.maxlen and ring[0][0] > since:
+            return None
+        changes = {}
+        for changed_version, session_key, encoded in ring:
+            if since < changed_version <= version:
+                # Re-inserted so the order matches where the session now sits in the full list
+                changes.pop(session_key, None)
+                changes[session_key] = encoded
+        return changes
+    
+    def _delta_body(self, changes, version_tag):
+        """Encoded /api/sessions delta: changed active sessions and the keys that left the list"""
+        updated = [encoded for encoded in changes.values() if encoded is not None]
+        removed = [session_key for session_key, encoded in changes.items() if encoded is None]
+        return b''.join((
+            b'{"delta":true,"sessions":[', b','.join(updated),
+            b'],"removed":', _dumps(removed),
+            b',"count":', str(len(self._active_snapshot)).encode('ascii'),
+            b',"version":', _dumps(version_tag),
+            b',"last_updated":', _dumps(_iso_now()), b'}'
+        ))
+    
+    def _sessions_updated(self, changed_keys):
+        """Publish a session change to the snapshot, the change ring, /api/status and /api/stream"""
+        # Rebuilt once per change on the writer side; readers take the tuple without copying or locking
+        session_json = self._session_json
+        active_keys = self._active_keys
+        self._active_snapshot = tuple(session_json[key] for key in active_keys)
+        # Recorded before the version bump so a reader that sees the new version finds its changes
+        version = self._sessions_version + 1
+        self._change_ring.extend(
+            (version, key, session_json[key] if key in active_keys else None) for key in changed_keys
+        )
+        self._status_cache = (0.0, None)
+        self._sessions_version = version
+        # The updates of one poll arrive back to back; they reach stream clients as a single frame
+        with self._sessions_changed:
+            if self._push_pending or not self._stream_clients:
+                return
+            self._push_pending = True
+        timer = Timer(0.05, self._push_sessions)
+        timer.daemon = True
+        timer.start()
+    
+    def _push_sessions(self):
+        """Encode the current sessions once and hand the frame to every /api/stream client"""
+        with self._sessions_changed:
+            self._push_pending = False
+            self._stream_frame = (self._stream_frame[0] + 1, b'data: ' + self.get_sessions_body() + b'\n\n')
+            self._sessions_changed.notify_all()
+    
+    def get_active_sessions_json(self):
+        """Encoded playing or paused sessions, safe to use from a request thread
         
-        @self.app.route('/api/lastfm/stats')
-        def api_lastfm_stats():
-            """API endpoint for Last.fm user statistics"""
-            if not self.bridge.config.get('lastfm', {}).get('enabled', False):
-                return jsonify({
-                    'enabled': False,
-                    'message': 'Last.fm integration is disabled'
-                })
-            
-            if not self.bridge.lastfm_network:
-                return jsonify({
-                    'enabled': True,
-                    'connected': False,
-                    'message': 'Last.fm connection not available'
-                })
-            
-            try:
-                stats = self.bridge.get_lastfm_user_stats()
-                return jsonify({
-                    'enabled': True,
-                    'connected': True,
-                    'stats': stats,
-                    'last_updated': datetime.now().isoformat()
-                })
-            except Exception as e:
-                return jsonify({
-                    'enabled': True,
-                    'connected': False,
-                    'error': str(e),
-                    'last_updated': datetime.now().isoformat()
-                }), 500
+        The bridge's poll loop is the only writer of _session_json and _active_keys and swaps in
+        a new tuple after each change, so routes never iterate a dict that is being modified.
+        """
+        return self._active_snapshot
     
     def get_uptime(self):
         """Get application uptime"""
-        if hasattr(self.bridge, 'start_time'):
-            delta = datetime.now() - self.bridge.start_time
-            hours, remainder = divmod(int(delta.total_seconds()), 3600)
-            minutes, seconds = divmod(remainder, 60)
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-        return "00:00:00"
-    
-    def update_session(self, music_info, topic):
-        """Update current session information for the web interface"""
-        session_key = f"{music_info['user']}_{music_info.get('device', 'unknown')}"
+        if self._start_monotonic is None:
+            return "00:00:00"
+        elapsed = int(time.monotonic() - self._start_monotonic)
+        cached_elapsed, uptime = self._uptime
+        if elapsed != cached_elapsed:
+            uptime = f"{elapsed // 3600:02d}:{elapsed % 3600 // 60:02d}:{elapsed % 60:02d}"
+            self._uptime = (elapsed, uptime)
+        return uptime
+    
+    def update_session(self, music_info, topic, session_key=None):
+        """Update current session information for the web interface
         
-        session_data = {
-            'session_key': session_key,
-            'user': music_info.get('user', 'Unknown'),
-            'device': music_info.get('device', 'Unknown'),
-            'device_original': music_info.get('device_original', 'Unknown'),
-            'title': music_info.get('title', ''),
-            'artist': music_info.get('artist', ''),
-            'album': music_info.get('album', ''),
-            'status': music_info.get('status', 'unknown'),
-            'progress_percent': music_info.get('progress_percent', 0),
-            'duration_formatted': music_info.get('duration_formatted', '0:00'),
-            'position_formatted': music_info.get('position_formatted', '0:00'),
-            'remaining_formatted': music_info.get('remaining_formatted', '0:00'),
-            'thumb': music_info.get('thumb', ''),
-            'year': music_info.get('year', ''),
-            'track_number': music_info.get('track_number', ''),
-            'bitrate': music_info.get('bitrate', ''),
-            'codec': music_info.get('codec', ''),
-            'topic': topic,
-            'last_updated': datetime.now().isoformat()
-        }
+        The bridge passes the session_key it already built for this poll; it is only derived
+        here when called without one.
+        """
+        if session_key is None:
+            session_key = f"{music_info['user']}_{music_info.get('device', 'unknown')}"
+        
+        # Defaults and session fields merged in one step, then read by a single itemgetter call
+        session_data = {'session_key': session_key}
+        session_data.update(zip(_SESSION_FIELDS, _session_values({**_SESSION_DEFAULTS, **music_info})))
+        session_data['topic'] = topic
         
-        # Update or add session
+        # Nothing shown on the dashboard changed, keep the stored entry and its encoded form
+        previous = self.current_sessions.get(session_key)
+        if previous is not None and session_data.items() <= previous.items():
+            return
+        session_data['last_updated'] = _iso_now()
+        
+        # Update or add session, encoded once here rather than on every API request
         self.current_sessions[session_key] = session_data
+        self._session_json[session_key] = _dumps(session_data)
+        if session_data['status'] in ('playing', 'paused'):
+            self._active_keys[session_key] = None
+        else:
+            self._active_keys.pop(session_key, None)
+        self._sessions_updated((session_key,))
     
     def remove_session(self, session_key):
         """Remove a session that's no longer active"""
-        if session_key in self.current_sessions:
-            del self.current_sessions[session_key]
+        if self._drop_session(session_key):
+            self._sessions_updated((session_key,))
+    
+    def _drop_session(self, session_key):
+        """Forget a session without publishing the change; True if it was known"""
+        if session_key not in self.current_sessions:
+            return False
+        del self.current_sessions[session_key]
+        self._session_json.pop(session_key, None)
+        self._active_keys.pop(session_key, None)
+        return True
+    
+    def clear_sessions(self):
+        """Remove all sessions once nothing is playing"""
+        if self.current_sessions:
+            removed_keys = list(self.current_sessions)
+            self.current_sessions.clear()
+            self._session_json.clear()
+            self._active_keys.clear()
+            self._sessions_updated(removed_keys)
     
     def clear_inactive_sessions(self, active_session_keys):
         """Remove sessions that are no longer active"""
         inactive_keys = set(self.current_sessions.keys()) - active_session_keys
-        for key in inactive_keys:
-            self.remove_session(key)
+        if inactive_keys:
+            # Published once for the whole batch rather than per removed session
+            for key in inactive_keys:
+                self._drop_session(key)
+            self._sessions_updated(inactive_keys)
     
-    def run(self, host='0.0.0.0', port=5000, debug=False):
-        """Run the Flask web server"""
-        self.app.run(host=host, port=port, debug=debug, use_reloader=False)
+    def run(self, host='0.0.0.0', port=5000, debug=False, threads=4):
+        """Run the web server, using waitress when installed and Flask's dev server otherwise"""
+        # Two threads always stay free for the page and the polled API routes
+        self._max_streams = max(threads - 2, 1)
+        if WAITRESS_AVAILABLE and not debug:
+            serve(self.app, host=host, port=port, threads=threads)
+        else:
+            self.app.run(host=host, port=port, debug=debug, use_reloader=False)